@@ -2,17 +2,30 @@ import datetime
 import json
 
 from adminplus.sites import AdminSitePlus
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.shortcuts import render, redirect
+from django.urls import reverse
+from django.utils.html import format_html
 from django import forms
 
-from .models import Show, Episode
-from .utils import fetch_show, download_episode, download_by_urls, get_shows, print_messages
+from .circuit_breaker import CircuitBreaker, upstream_hosts
+from .jobs import enqueue
+from .models import Show, Episode, ShowStats, Job, Notification
+from .utils import refresh_show_stats
 
 # Use AdminSitePlus instead of default admin
 admin_site = AdminSitePlus(name='backoffice')
 admin_site.site_header = "My Custom AdminPlus Dashboard"
 
+
+def queue_job(request, kind, **params):
+    """Enqueue a background job for the `run_worker` command and tell the user."""
+    job = enqueue(kind, user=request.user if request.user.is_authenticated else None, **params)
+    url = reverse('backoffice:backoffice_job_change', args=[job.pk])
+    messages.info(request, format_html('Job <a href="{}">#{}</a> queued: {}', url, job.pk, kind))
+    return job
+
+
 # Custom Actions
 
 
@@ -28,45 +41,76 @@ def disable_show_action(modeladmin, request, queryset):
 
 @admin.action(description="Fetch Shows")
 def fetch_show_action(modeladmin, request, queryset):
-    for show in queryset.all():
-        fetch_show(show)
+    queue_job(request, 'fetch_shows', show_ids=list(queryset.values_list('pk', flat=True)))
 
 
 @admin.action(description="Mark as Downloaded")
 def mark_downloaded_action(modeladmin, request, queryset):
+    show_ids = set(queryset.values_list('show_id', flat=True))
     queryset.update(downloaded=True)
+    refresh_show_stats(show_ids)
 
 
 @admin.action(description="Download Episodes")
 def download_episodes_action(modeladmin, request, queryset):
-    resp = download_episode(queryset.all())
-    print_messages(request, resp)
+    queue_job(request, 'download_episodes', episode_ids=list(queryset.values_list('pk', flat=True)))
+
+
+# Custom Filters
+
+
+class ToDownloadListFilter(admin.SimpleListFilter):
+    title = 'to download'
+    parameter_name = 'to_download'
+
+    def lookups(self, request, model_admin):
+        return [('1', 'Yes')]
+
+    def queryset(self, request, queryset):
+        if self.value() == '1':
+            return queryset.to_download()
+        return queryset
 
 
 # Admin Classes
 class ShowAdmin(admin.ModelAdmin):
     model = Show
-    list_display = ('tst_id', 'name', 'get_episode', 'get_to_watch', 'get_to_download', 'enabled')
+    list_display = ('tst_id', 'name', 'get_episode', 'get_to_watch', 'get_to_download', 'get_next_air_date', 'enabled')
     list_filter = ('name', 'enabled')
     actions = [enable_show_action, disable_show_action, fetch_show_action]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('stats')
+
+    @staticmethod
+    def _stats(obj):
+        return getattr(obj, 'stats', None) or ShowStats(show=obj)
+
     def get_episode(self, obj):
-        return len(obj.episode_set.all())
+        return self._stats(obj).total
     get_episode.short_description = 'Number of Episode'
+    get_episode.admin_order_field = 'stats__total'
 
     def get_to_watch(self, obj):
-        return len(obj.episode_set.filter(aired=True, watched=False))
+        return self._stats(obj).to_watch
     get_to_watch.short_description = 'Number to Watch'
+    get_to_watch.admin_order_field = 'stats__to_watch'
 
     def get_to_download(self, obj):
-        return len(obj.episode_set.filter(aired=True, watched=False, downloaded=False))
+        return self._stats(obj).to_download
     get_to_download.short_description = 'Number to Download'
+    get_to_download.admin_order_field = 'stats__to_download'
+
+    def get_next_air_date(self, obj):
+        return self._stats(obj).next_air_date
+    get_next_air_date.short_description = 'Next Air Date'
+    get_next_air_date.admin_order_field = 'stats__next_air_date'
 
 
 class EpisodeAdmin(admin.ModelAdmin):
     model = Episode
     list_display = ('tst_id', 'name', 'get_show', 'season', 'number', 'date', 'aired', 'watched', 'downloaded')
-    list_filter = ('show__name', 'season', 'aired', 'downloaded', 'watched', 'show__enabled')
+    list_filter = (ToDownloadListFilter, 'show__name', 'season', 'aired', 'downloaded', 'watched', 'show__enabled')
     ordering = ('-date',)
     actions = [download_episodes_action, mark_downloaded_action]
 
@@ -75,40 +119,92 @@ class EpisodeAdmin(admin.ModelAdmin):
 
     get_show.short_description = 'Show'
 
+    # Keep the ShowStats of the Show changelist in step with edits made here
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        refresh_show_stats({obj.show_id, form.initial.get('show')} - {None})
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        refresh_show_stats([obj.show_id])
+
+    def delete_queryset(self, request, queryset):
+        show_ids = set(queryset.values_list('show_id', flat=True))
+        super().delete_queryset(request, queryset)
+        refresh_show_stats(show_ids)
+
+
+class JobAdmin(admin.ModelAdmin):
+    model = Job
+    list_display = ('id', 'kind', 'status', 'progress', 'user', 'created_at', 'started_at', 'finished_at')
+    list_filter = ('status', 'kind')
+    ordering = ('-created_at',)
+    readonly_fields = ('kind', 'params', 'status', 'progress', 'get_result', 'error', 'user',
+                       'created_at', 'started_at', 'finished_at', 'claimed_until')
+    exclude = ('result',)
+
+    def get_result(self, obj):
+        return format_html('<pre>{}</pre>', json.dumps(obj.result, indent=2, ensure_ascii=False))
+    get_result.short_description = 'Result'
+
+    def has_add_permission(self, request):
+        return False
+
+
+class NotificationAdmin(admin.ModelAdmin):
+    model = Notification
+    list_display = ('id', 'subject', 'recipient', 'created_at', 'sent_at', 'attempts', 'next_attempt_at')
+    list_filter = (('sent_at', admin.EmptyFieldListFilter), 'recipient')
+    ordering = ('-created_at',)
+    readonly_fields = ('recipient', 'subject', 'body', 'created_at', 'sent_at', 'attempts', 'next_attempt_at', 'error')
+
+    def has_add_permission(self, request):
+        return False
+
+
 # Custom view
 
 
 @admin_site.register_view('list_to_download', urlname='list_to_download', name='List the "to download" episodes')
 def list_to_download_action(request):
-    return redirect('/admin/backoffice/episode/?aired__exact=1&downloaded__exact=0&show__enabled__exact=1&watched__exact=0')
+    return redirect('/admin/backoffice/episode/?to_download=1')
 
 
 @admin_site.register_view('fetch_show', urlname='fetch_show', name='Fetch the enabled shows')
 def fetch_show_action(request):
-    for s in Show.objects.filter(enabled=True):
-        fetch_show(s)
+    queue_job(request, 'fetch_shows', enabled=True)
     return redirect('/admin')
 
 
 @admin_site.register_view('get_show', urlname='get_show', name='Get the shows')
 def get_show_action(request):
-    get_shows()
+    queue_job(request, 'get_shows')
     return redirect('/admin')
 
 
 @admin_site.register_view('download_episode', urlname='download_episode', name='Download the "to download" episodes')
 def download_episode_action(request):
-    episode_list = Episode.objects.filter(
-        show__enabled=True,
-        watched=False,
-        downloaded=False,
-        aired=True,
-        date__lte=datetime.date.today())
-    resp = download_episode(episode_list)
-    print_messages(request, resp)
+    queue_job(request, 'download_episodes', to_download=True)
     return redirect('/admin')
 
 
+@admin_site.register_view('circuit_breakers', urlname='circuit_breakers', name='Upstream circuit breakers')
+def circuit_breakers_view(request):
+    if request.method == 'POST' and request.POST.get('host') in upstream_hosts():
+        CircuitBreaker(request.POST['host']).reset()
+        messages.info(request, f"Circuit breaker of {request.POST['host']} reset")
+        return redirect(request.path)
+    breakers = []
+    for host in upstream_hosts():
+        status = CircuitBreaker(host).status()
+        for field in ('opened_at', 'retry_at'):
+            if status[field] is not None:
+                status[field] = datetime.datetime.fromtimestamp(status[field], tz=datetime.timezone.utc)
+        breakers.append(status)
+    return render(request, 'admin/circuit_breakers.html', {'breakers': breakers, 'title': 'Circuit breakers'})
+
+
 # ------------------------------
 # Custom view with a form
 # ------------------------------
@@ -128,16 +224,18 @@ def download_url(request):
             except json.JSONDecodeError:
                 urls = []
 
-            resp = download_by_urls(urls)
-            print_messages(request, resp)
-
-            return render(request, 'admin/download_url.html', {'form': UrlListForm()})
+            job = queue_job(request, 'download_urls', urls=urls)
+            return redirect(f"{request.path}?job={job.pk}")
     else:
         form = UrlListForm()
 
-    return render(request, 'admin/download_url.html', {'form': form})
+    job_id = request.GET.get('job', '')
+    job = Job.objects.filter(kind='download_urls', pk=job_id).first() if job_id.isdigit() else None
+    return render(request, 'admin/download_url.html', {'form': form, 'job': job})
 
 
 # Register Admin views
 admin_site.register(Show, ShowAdmin)
 admin_site.register(Episode, EpisodeAdmin)
+admin_site.register(Job, JobAdmin)
+admin_site.register(Notification, NotificationAdmin)
@@ -0,0 +1,92 @@
+"""
+Circuit breakers for the upstream APIs, one per host.
+
+After CIRCUIT_BREAKER_THRESHOLD consecutive failures (connection errors,
+timeouts, 429 or 5xx once retries are exhausted) a breaker opens: calls to the
+host fail fast with CircuitOpenError for CIRCUIT_BREAKER_COOLDOWN seconds.
+Then a single call is let through half-open as a probe; its success closes
+the breaker, its failure opens it again. The state is kept in the
+RATE_LIMIT_CACHE_ALIAS cache so every process sharing it sees the same breaker.
+"""
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from urllib.parse import urlparse
+
+from backoffice.rate_limit import CacheLock
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling a host whose breaker is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, host, threshold=None, cooldown=None, cache=None):
+        self.host = host
+        self.key = f"circuit::{host}"
+        self.threshold = threshold or getattr(settings, "CIRCUIT_BREAKER_THRESHOLD", 5)
+        self.cooldown = cooldown or getattr(settings, "CIRCUIT_BREAKER_COOLDOWN", 60)
+        self.cache = cache or caches[getattr(settings, "RATE_LIMIT_CACHE_ALIAS", "default")]
+
+    def status(self, now=None):
+        """Return the breaker state as a dict: state, failures, opened_at and retry_at."""
+        now = time.time() if now is None else now
+        data = self.cache.get(self.key) or {'failures': 0, 'opened_at': None}
+        state = CLOSED
+        if data['opened_at'] is not None:
+            state = OPEN if now < data['opened_at'] + self.cooldown else HALF_OPEN
+        retry_at = data['opened_at'] + self.cooldown if data['opened_at'] is not None else None
+        return {'host': self.host, 'state': state, 'failures': data['failures'],
+                'opened_at': data['opened_at'], 'retry_at': retry_at}
+
+    def before_call(self, now=None):
+        """
+        Raise CircuitOpenError unless a call may go through. Once the cooldown
+        is over, only the first caller gets to probe until the probe reports back.
+        """
+        status = self.status(now)
+        if status['state'] == CLOSED:
+            return
+        if status['state'] == HALF_OPEN and self.cache.add(f"{self.key}::probe", 1, self.cooldown):
+            return
+        raise CircuitOpenError(f"Circuit open for {self.host} after {status['failures']} failures")
+
+    def record_success(self):
+        if self.cache.get(self.key) is None:
+            return
+        with CacheLock(self.cache, f"{self.key}::lock"):
+            self.cache.delete(self.key)
+            self.cache.delete(f"{self.key}::probe")
+
+    def record_failure(self, now=None):
+        now = time.time() if now is None else now
+        with CacheLock(self.cache, f"{self.key}::lock"):
+            data = self.cache.get(self.key) or {'failures': 0, 'opened_at': None}
+            data['failures'] += 1
+            if data['opened_at'] is not None or data['failures'] >= self.threshold:
+                # A failed probe, or the threshold reached: (re)open for a full cooldown
+                data['opened_at'] = now
+                self.cache.delete(f"{self.key}::probe")
+            self.cache.set(self.key, data, None)
+
+    def reset(self):
+        self.cache.delete_many([self.key, f"{self.key}::probe"])
+
+
+def breaker_for(url):
+    """Return the breaker of the host of `url`, or None when breakers are disabled."""
+    if not getattr(settings, "CIRCUIT_BREAKER_THRESHOLD", 5):
+        return None
+    return CircuitBreaker(urlparse(url).hostname)
+
+
+def upstream_hosts():
+    """Host names of the configured upstream APIs."""
+    urls = [getattr(settings, name, '') for name in ('USER_URL', 'SHOW_URL', 'YGG_PATH')]
+    return sorted({urlparse(url).hostname for url in urls if url})
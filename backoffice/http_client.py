@@ -0,0 +1,140 @@
+"""
+Shared HTTP client for the outbound API calls of backoffice.
+
+A single requests.Session is kept per process so connections to the show API
+and the tracker are pooled and reused (keep-alive) instead of paying a new
+TCP+TLS handshake per call. Timeouts and retries with backoff on 429/5xx are
+applied to every request, as well as the shared per-host rate limits of
+backoffice.rate_limit and circuit breakers of backoffice.circuit_breaker;
+all knobs come from settings.
+"""
+import threading
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+from urllib3.util.retry import Retry
+
+from backoffice.circuit_breaker import breaker_for
+from backoffice.rate_limit import bucket_for
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+_wait_times = {}
+_wait_times_lock = threading.Lock()
+
+
+def get_session():
+    """Return the process-wide pooled session, building it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = _build_session()
+        return _session
+
+
+def reset_session():
+    """Close the pooled session so the next call rebuilds it from settings."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def get(url, **kwargs):
+    """
+    GET `url` through the pooled session.
+    Applies the default timeout unless one is given and holds a per-host slot
+    while the request is sent. Fails fast with CircuitOpenError while the
+    breaker of the host is open; errors, 429 and 5xx responses count as failures.
+    """
+    kwargs.setdefault("timeout", get_timeout())
+    breaker = breaker_for(url)
+    if breaker is not None:
+        breaker.before_call()
+    try:
+        with host_slot(url):
+            throttle(url)
+            response = get_session().get(url, **kwargs)
+    except requests.exceptions.RequestException:
+        if breaker is not None:
+            breaker.record_failure()
+        raise
+    if breaker is not None:
+        if response.status_code == 429 or response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+    return response
+
+
+def get_timeout():
+    return (
+        getattr(settings, "HTTP_CONNECT_TIMEOUT", 5),
+        getattr(settings, "HTTP_READ_TIMEOUT", 30),
+    )
+
+
+def host_slot(url):
+    """
+    Return the semaphore capping concurrent requests to the host of `url`
+    (settings.MAX_CONNECTIONS_PER_HOST, shared by every thread of the process).
+    """
+    host = urlparse(url).netloc
+    with _host_slots_lock:
+        if host not in _host_slots:
+            limit = getattr(settings, "MAX_CONNECTIONS_PER_HOST", 4)
+            _host_slots[host] = threading.BoundedSemaphore(limit)
+        return _host_slots[host]
+
+
+def throttle(url):
+    """
+    Take a token from the bucket of the host of `url` (settings.HTTP_RATE_LIMITS),
+    shared by every process using the same cache. Blocks the calling thread
+    until the request is allowed and returns how long it waited.
+    """
+    host = urlparse(url).hostname
+    bucket = bucket_for(host)
+    if bucket is None:
+        return 0
+    wait = bucket.acquire()
+    if wait > 0:
+        with _wait_times_lock:
+            _wait_times[host] = _wait_times.get(host, 0) + wait
+    return wait
+
+
+def wait_times(reset=False):
+    """Return the seconds this process spent waiting on rate limits, by host."""
+    with _wait_times_lock:
+        times = dict(_wait_times)
+        if reset:
+            _wait_times.clear()
+    return times
+
+
+def _build_session():
+    retry = Retry(
+        total=getattr(settings, "HTTP_RETRIES", 3),
+        backoff_factor=getattr(settings, "HTTP_BACKOFF_FACTOR", 0.5),
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=getattr(settings, "HTTP_POOL_CONNECTIONS", 10),
+        pool_maxsize=getattr(settings, "HTTP_POOL_MAXSIZE", 10),
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -0,0 +1,135 @@
+"""
+Database-backed background jobs.
+
+Admin views enqueue a Job row and return at once; the `run_worker` management
+command claims queued jobs, runs the matching handler and stores its progress,
+result or error on the row. Only the project database is needed.
+"""
+import logging
+import traceback
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from backoffice.models import Job, Show, Episode
+from backoffice.utils import fetch_shows, get_shows, download_queue, download_by_urls
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """Register the decorated function as the handler of `kind` jobs."""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, user=None, **params):
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = Job.objects.create(kind=kind, params=params, user=user)
+    logger.info(f"Queued job {job}")
+    return job
+
+
+def claim_next_job():
+    """
+    Atomically move the oldest queued job to running and return it, or None.
+    Rows locked by another worker are skipped where the database supports it,
+    and the status check in the UPDATE keeps the claim safe everywhere else.
+    Running jobs whose lease expired first fail, as their worker is gone.
+    """
+    fail_lost_jobs()
+    with transaction.atomic():
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.QUEUED)
+            .order_by('created_at', 'pk')
+            .first()
+        )
+        if job is None:
+            return None
+        now = timezone.now()
+        lease = Job.lease_end(now)
+        claimed = Job.objects.filter(pk=job.pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, started_at=now, claimed_until=lease)
+    if not claimed:
+        return None
+    job.status, job.started_at, job.claimed_until = Job.RUNNING, now, lease
+    return job
+
+
+def fail_lost_jobs(now=None):
+    """
+    Fail the running jobs whose worker died or was restarted mid-job, seen by
+    their lease expiring. They are not requeued: a job that kills its worker
+    would otherwise run forever. Returns how many jobs failed.
+    """
+    now = now or timezone.now()
+    lost = Job.objects.filter(status=Job.RUNNING, claimed_until__lt=now).update(
+        status=Job.FAILED, finished_at=now, error="The worker running the job stopped before it finished")
+    if lost:
+        logger.warning(f"Failed {lost} job(s) left running by a lost worker")
+    return lost
+
+
+def run_job(job):
+    """Run a claimed job and store its result or error."""
+    logger.info(f"Running job {job}")
+    try:
+        job.result = JOB_HANDLERS[job.kind](job, **job.params)
+        job.status = Job.DONE
+    except Exception as exc:
+        logger.error(f"Job {job} failed: {exc}")
+        job.error = traceback.format_exc()
+        job.status = Job.FAILED
+    job.finished_at = timezone.now()
+    job.save(update_fields=['result', 'status', 'error', 'finished_at'])
+    return job
+
+
+def run_pending_jobs():
+    """Run queued jobs until the queue is empty; return how many ran."""
+    count = 0
+    while (job := claim_next_job()) is not None:
+        run_job(job)
+        count += 1
+    return count
+
+
+# Handlers
+
+
+@job_handler('get_shows')
+def get_shows_job(job):
+    get_shows(user=job.user)
+    return {}
+
+
+@job_handler('fetch_shows')
+def fetch_shows_job(job, show_ids=None, enabled=False):
+    shows = Show.objects.filter(enabled=True) if enabled else Show.objects.filter(pk__in=show_ids or [])
+    shows = list(shows)
+    result = {}
+    results = fetch_shows(shows, workers=getattr(settings, 'FETCH_WORKERS', 1), user=job.user)
+    for done, (show, exc) in enumerate(results, 1):
+        result[str(show)] = exc is None
+        job.set_progress(f"{done}/{len(shows)} shows")
+    return result
+
+
+@job_handler('download_episodes')
+def download_episodes_job(job, episode_ids=None, to_download=False):
+    episodes = Episode.objects.to_download().eligible() if to_download else Episode.objects.filter(pk__in=episode_ids or [])
+    job.set_progress(f"Looking up {episodes.count()} episodes")
+    return {str(episode): res for episode, res in download_queue(episodes, user=job.user).items()}
+
+
+@job_handler('download_urls')
+def download_urls_job(job, urls=()):
+    job.set_progress(f"Downloading {len(urls)} URLs")
+    return download_by_urls(urls)
@@ -0,0 +1,98 @@
+"""
+Incremental parsing of large JSON documents.
+
+Only the part of the document being decoded is kept in memory, which lets
+callers walk big API responses item by item instead of loading them whole.
+"""
+import codecs
+import json
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+def iter_array_items(chunks, key):
+    """
+    Yield one by one the items of the array stored under `key` in the
+    top-level JSON object streamed by `chunks` (str or bytes pieces).
+    """
+    buffer = _Buffer(chunks)
+    buffer.expect("{")
+    if buffer.peek() == "}":
+        return
+    while True:
+        name = buffer.value()
+        buffer.expect(":")
+        if name == key:
+            buffer.expect("[")
+            if buffer.peek() == "]":
+                return
+            while True:
+                yield buffer.value()
+                if buffer.peek() == "]":
+                    return
+                buffer.expect(",")
+        buffer.value()
+        if buffer.peek() == "}":
+            return
+        buffer.expect(",")
+
+
+class _Buffer:
+    """Text window over a chunk iterator, consumed from the left."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Append the next non-empty chunk, dropping what was consumed. Return False at end of stream."""
+        if self.eof:
+            return False
+        for chunk in self._chunks:
+            if isinstance(chunk, bytes):
+                chunk = self._decoder.decode(chunk)
+            if chunk:
+                self.text = self.text[self.pos:] + chunk
+                self.pos = 0
+                return True
+        self.text = self.text[self.pos:] + self._decoder.decode(b"", final=True)
+        self.pos = 0
+        self.eof = True
+        return False
+
+    def peek(self):
+        """Skip whitespace and return the next character, or None at end of stream."""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return None
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in JSON stream, found {found!r}")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value, reading more chunks as needed."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            if end == len(self.text) and not self.eof:
+                # A number at the end of the window may continue in the next chunk
+                self.fill()
+                continue
+            self.pos = end
+            return value
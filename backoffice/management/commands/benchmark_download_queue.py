@@ -0,0 +1,87 @@
+import datetime
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from backoffice.models import Show, Episode
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Time the "to download" queue query while the Episode table grows (all rows are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            nargs='+',
+            type=int,
+            default=[1000, 10000, 100000, 300000],
+            help='Table sizes (number of synthetic episodes) at which the query is timed',
+        )
+        parser.add_argument(
+            '--pending',
+            type=int,
+            default=50,
+            help='Number of synthetic episodes waiting to be downloaded; all others are history',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Runs per size; the best one is reported',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(sorted(options['sizes']), options['pending'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _run(self, sizes, pending, repeat):
+        rng = random.Random(0)
+        today = datetime.date.today()
+        first_id = (Episode.objects.order_by('-tst_id').values_list('tst_id', flat=True).first() or 0) + 1
+        show_id = (Show.objects.order_by('-tst_id').values_list('tst_id', flat=True).first() or 0) + 1
+        shows = Show.objects.bulk_create([
+            Show(tst_id=show_id + i, name=f"Benchmark {i}", enabled=i % 2 == 0) for i in range(200)
+        ])
+
+        self.stdout.write(self.style.HTTP_INFO(f"{'episodes':>10} {'matches':>8} {'best ms':>9}"))
+        created = 0
+        for size in sizes:
+            batch = []
+            while created < size:
+                is_pending = created < pending
+                batch.append(Episode(
+                    tst_id=first_id + created,
+                    show=shows[created % len(shows)],
+                    name="",
+                    season=created // 1000 + 1,
+                    number=created % 1000 + 1,
+                    date=today - datetime.timedelta(days=rng.randint(0, 3650)),
+                    aired=True,
+                    watched=not is_pending,
+                    downloaded=not is_pending,
+                ))
+                created += 1
+                if len(batch) == 5000:
+                    Episode.objects.bulk_create(batch)
+                    batch = []
+            Episode.objects.bulk_create(batch)
+
+            queryset = Episode.objects.to_download(today)
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                matches = len(list(queryset.values_list('pk', flat=True)))
+                timings.append(time.perf_counter() - start)
+            self.stdout.write(f"{size:>10} {matches:>8} {min(timings) * 1000:>9.2f}")
+
+        self.stdout.write(self.style.HTTP_INFO("Query plan:"))
+        self.stdout.write(Episode.objects.to_download(today).explain())
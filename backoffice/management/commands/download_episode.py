@@ -1,6 +1,6 @@
-import datetime
 from django.core.management.base import BaseCommand, CommandError
-from backoffice.utils import download_episode
+from backoffice import http_client
+from backoffice.utils import download_queue
 from backoffice.models import Episode
 
 
@@ -19,15 +19,13 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         if options['to-watch']:
-            episode_list = Episode.objects.filter(
-                show__enabled=True,
-                watched=False,
-                downloaded=False,
-                aired=True,
-                date__lte=datetime.date.today())
+            episode_list = Episode.objects.to_download().eligible()
         else:
             episode_list = Episode.objects.filter(pk__in=options['episode_id'])
         try:
-            download_episode(episode_list)
+            download_queue(episode_list)
         except Exception as exc:
             raise CommandError(f"{exc}") from exc
+
+        for host, waited in http_client.wait_times().items():
+            self.stdout.write(self.style.HTTP_INFO(f"Waited {waited:.1f}s on the {host} rate limit"))
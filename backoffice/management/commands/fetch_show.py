@@ -1,5 +1,7 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from backoffice.utils import fetch_show
+from backoffice import http_client
+from backoffice.utils import fetch_shows
 from backoffice.models import Show
 
 
@@ -24,17 +26,50 @@ class Command(BaseCommand):
             help='Update enabled',
         )
 
+        parser.add_argument(
+            '--due',
+            action='store_true',
+            dest='due',
+            default=False,
+            help='Update enabled shows whose next check time has passed',
+        )
+
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            dest='force',
+            default=False,
+            help='Re-sync even if the show payload did not change',
+        )
+
+        parser.add_argument(
+            '--workers',
+            type=int,
+            dest='workers',
+            default=getattr(settings, 'FETCH_WORKERS', 1),
+            help='Number of shows downloaded in parallel',
+        )
+
     def handle(self, *args, **options):
         if options['all']:
             shows = Show.objects.all()
         elif options['enabled']:
             shows = Show.objects.filter(enabled=True)
+        elif options['due']:
+            shows = Show.objects.due()
         else:
             shows = Show.objects.filter(pk__in=options['show_id'])
-        for show in shows:
-            self.stdout.write(self.style.HTTP_INFO(f"Fetching {show}..."))
-            try:
-                fetch_show(show)
-                self.stdout.write(self.style.SUCCESS(f"Successfully fetch {show}"))
-            except Exception as exc:
-                raise CommandError(f"{exc}") from exc
+        self.stdout.write(self.style.HTTP_INFO(f"Fetching {len(shows)} show(s) with {options['workers']} worker(s)..."))
+        failed = []
+        for show, exc in fetch_shows(shows, workers=options['workers'], force=options['force']):
+            if exc:
+                # Keep going: once an upstream breaker is open the other shows fail fast
+                self.stderr.write(self.style.ERROR(f"Failed to fetch {show}: {exc}"))
+                failed.append(show)
+                continue
+            self.stdout.write(self.style.SUCCESS(f"Successfully fetch {show}"))
+
+        for host, waited in http_client.wait_times().items():
+            self.stdout.write(self.style.HTTP_INFO(f"Waited {waited:.1f}s on the {host} rate limit"))
+        if failed:
+            raise CommandError(f"Failed to fetch {len(failed)} show(s): {', '.join(map(str, failed))}")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from backoffice.notifications import flush_notifications
+
+
+class Command(BaseCommand):
+    help = 'Send the pending notification digests'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            dest='force',
+            default=False,
+            help='Send every pending notification without waiting for the digest window',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sent = flush_notifications(force=options['force'])
+        except Exception as exc:
+            raise CommandError(f"{exc}") from exc
+        self.stdout.write(self.style.SUCCESS(f"Sent {sent} digest(s)"))
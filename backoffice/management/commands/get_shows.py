@@ -1,4 +1,5 @@
 from django.core.management.base import BaseCommand, CommandError
+from backoffice import http_client
 from backoffice.utils import get_shows
 
 
@@ -12,3 +13,6 @@ class Command(BaseCommand):
             self.stdout.write(self.style.SUCCESS('Successfully fetch shows'))
         except Exception as exc:
             raise CommandError(f"{exc}") from exc
+
+        for host, waited in http_client.wait_times().items():
+            self.stdout.write(self.style.HTTP_INFO(f"Waited {waited:.1f}s on the {host} rate limit"))
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from backoffice.jobs import claim_next_job, run_job
+from backoffice.notifications import flush_notifications
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            dest='once',
+            default=False,
+            help='Exit once the queue is empty instead of polling',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            dest='sleep',
+            default=5,
+            help='Seconds to wait between polls of an empty queue',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.HTTP_INFO("Waiting for jobs..."))
+        while True:
+            close_old_connections()
+            job = claim_next_job()
+            if job is None:
+                # Idle: send the notification digests that are due
+                flush_notifications()
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+            self.stdout.write(self.style.HTTP_INFO(f"Running job {job}..."))
+            run_job(job)
+            if job.status == job.DONE:
+                self.stdout.write(self.style.SUCCESS(f"Successfully ran job {job}"))
+            else:
+                self.stdout.write(self.style.ERROR(f"Job {job} failed"))
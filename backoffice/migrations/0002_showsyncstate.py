@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backoffice', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShowSyncState',
+            fields=[
+                ('show', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sync_state', serialize=False, to='backoffice.show')),
+                ('etag', models.CharField(blank=True, max_length=255)),
+                ('last_modified', models.CharField(blank=True, max_length=64)),
+                ('digest', models.CharField(blank=True, max_length=64)),
+                ('synced_at', models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
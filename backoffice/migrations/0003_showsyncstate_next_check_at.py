@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backoffice', '0002_showsyncstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='showsyncstate',
+            name='next_check_at',
+            field=models.DateTimeField(db_index=True, null=True),
+        ),
+    ]
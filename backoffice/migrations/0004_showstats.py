@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:30
+
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Min, Q
+
+
+def populate_show_stats(apps, schema_editor):
+    Show = apps.get_model('backoffice', 'Show')
+    Episode = apps.get_model('backoffice', 'Episode')
+    ShowStats = apps.get_model('backoffice', 'ShowStats')
+    rows = Episode.objects.values('show_id').annotate(
+        total=Count('pk'),
+        to_watch=Count('pk', filter=Q(aired=True, watched=False)),
+        to_download=Count('pk', filter=Q(aired=True, watched=False, downloaded=False)),
+        next_air_date=Min('date', filter=Q(date__gte=datetime.date.today())),
+    )
+    stats = {row.pop('show_id'): row for row in rows}
+    ShowStats.objects.bulk_create(
+        [ShowStats(show_id=pk, **stats.get(pk, {})) for pk in Show.objects.values_list('pk', flat=True)],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backoffice', '0003_showsyncstate_next_check_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShowStats',
+            fields=[
+                ('show', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='backoffice.show')),
+                ('total', models.IntegerField(default=0)),
+                ('to_watch', models.IntegerField(default=0)),
+                ('to_download', models.IntegerField(default=0)),
+                ('next_air_date', models.DateField(null=True)),
+            ],
+        ),
+        migrations.RunPython(populate_show_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backoffice', '0004_showstats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='episode',
+            index=models.Index(fields=['downloaded', 'watched', 'aired', 'date'], name='episode_to_download_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backoffice', '0007_episode_claim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='episode',
+            name='last_lookup_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='episode',
+            name='lookup_attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='episode',
+            name='lookup_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='episode',
+            name='next_lookup_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,4 +1,19 @@
-from django.db import models
+import datetime
+
+from django.conf import settings
+from django.db import connections, models, transaction
+from django.utils import timezone
+
+
+class ShowQuerySet(models.QuerySet):
+    def due(self, now=None):
+        """Enabled shows never synced or whose next check time has passed."""
+        now = now or timezone.now()
+        return self.filter(enabled=True).filter(
+            models.Q(sync_state__isnull=True)
+            | models.Q(sync_state__next_check_at__isnull=True)
+            | models.Q(sync_state__next_check_at__lte=now)
+        )
 
 
 class Show(models.Model):
@@ -6,10 +21,73 @@ class Show(models.Model):
     tst_id = models.IntegerField(primary_key=True)
     enabled = models.BooleanField(default=False)
 
+    objects = ShowQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.name}"
 
 
+class EpisodeQuerySet(models.QuerySet):
+    def to_download(self, today=None):
+        """
+        Aired, unwatched and not yet downloaded episodes of enabled shows.
+        The flags are compared to explicit values: Django renders `flag=False`
+        as `NOT flag`, which cannot use episode_to_download_idx.
+        """
+        return self.filter(
+            show__enabled=True,
+            watched=models.Value(False),
+            downloaded=models.Value(False),
+            aired=models.Value(True),
+            date__lte=today or datetime.date.today())
+
+    def eligible(self, now=None):
+        """
+        Episodes whose lookup backoff is over. A backoff only holds for the
+        air date it was computed for, so a rescheduled episode is eligible again.
+        """
+        now = now or timezone.now()
+        return self.filter(
+            models.Q(next_lookup_at__isnull=True)
+            | models.Q(next_lookup_at__lte=now)
+            | ~models.Q(lookup_date=models.F('date'))
+        )
+
+    def claimable(self, now=None):
+        """Episodes not leased, or whose lease has expired."""
+        now = now or timezone.now()
+        return self.filter(models.Q(claimed_until__isnull=True) | models.Q(claimed_until__lte=now))
+
+    def claim(self, owner, limit=None, lease=None, now=None):
+        """
+        Lease up to `limit` claimable episodes to `owner` for `lease` seconds
+        (settings.DOWNLOAD_LEASE_SECONDS) and return them as a queryset.
+        Rows locked by a concurrent claim are skipped where the database
+        supports SKIP LOCKED, and the UPDATE re-checks the lease everywhere
+        else, so two workers never hold the same episode. Where the database
+        supports FOR UPDATE OF, only episode rows are locked, not the shows
+        joined by to_download().
+        """
+        now = now or timezone.now()
+        if lease is None:
+            lease = getattr(settings, 'DOWNLOAD_LEASE_SECONDS', 1800)
+        # MariaDB has no FOR UPDATE OF, nor SKIP LOCKED before 10.6
+        features = connections[self.db].features
+        locked = self.claimable(now).select_for_update(
+            skip_locked=features.has_select_for_update_skip_locked,
+            of=('self',) if features.has_select_for_update_of else (),
+        )
+        with transaction.atomic(using=self.db):
+            ids = list(locked.order_by('date', 'pk').values_list('pk', flat=True)[:limit])
+            self.model.objects.filter(pk__in=ids).claimable(now).update(
+                claimed_by=owner, claimed_until=now + datetime.timedelta(seconds=lease))
+        return self.model.objects.filter(pk__in=ids, claimed_by=owner)
+
+    def release(self, owner):
+        """Drop the leases `owner` holds on these episodes."""
+        return self.filter(claimed_by=owner).update(claimed_by='', claimed_until=None)
+
+
 class Episode(models.Model):
     name = models.CharField(max_length=255, blank=True)
     date = models.DateField(null=True)
@@ -20,6 +98,110 @@ class Episode(models.Model):
     aired = models.BooleanField()
     downloaded = models.BooleanField(default=False)
     watched = models.BooleanField()
+    claimed_by = models.CharField(max_length=128, blank=True)
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    # Lookup backoff: consecutive "no torrent found" results for the air date `lookup_date`
+    lookup_attempts = models.PositiveIntegerField(default=0)
+    last_lookup_at = models.DateTimeField(null=True, blank=True)
+    next_lookup_at = models.DateTimeField(null=True, blank=True)
+    lookup_date = models.DateField(null=True, blank=True)
+
+    objects = EpisodeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Serves EpisodeQuerySet.to_download: equality on the flags, range on the date
+            models.Index(fields=['downloaded', 'watched', 'aired', 'date'], name='episode_to_download_idx'),
+        ]
 
     def __str__(self):
         return f"{self.show.name} S{self.season:02d}E{self.number:02d}"
+
+
+class ShowSyncState(models.Model):
+    show = models.OneToOneField('Show', on_delete=models.CASCADE, primary_key=True, related_name='sync_state')
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True)
+    digest = models.CharField(max_length=64, blank=True)
+    synced_at = models.DateTimeField(null=True)
+    next_check_at = models.DateTimeField(null=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.show} synced at {self.synced_at}"
+
+
+class ShowStats(models.Model):
+    show = models.OneToOneField('Show', on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    total = models.IntegerField(default=0)
+    to_watch = models.IntegerField(default=0)
+    to_download = models.IntegerField(default=0)
+    next_air_date = models.DateField(null=True)
+
+    def __str__(self):
+        return f"{self.show} stats"
+
+
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=64)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    progress = models.CharField(max_length=255, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Lease of the worker running the job, renewed by set_progress
+    claimed_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind} ({self.status})"
+
+    def set_progress(self, progress):
+        """Store a progress message right away, outside of any result write, and renew the lease."""
+        self.progress = progress
+        self.claimed_until = Job.lease_end()
+        Job.objects.filter(pk=self.pk).update(progress=progress, claimed_until=self.claimed_until)
+
+    @staticmethod
+    def lease_end(now=None):
+        """End of a lease taken at `now` (settings.JOB_LEASE_SECONDS)."""
+        now = now or timezone.now()
+        return now + datetime.timedelta(seconds=getattr(settings, 'JOB_LEASE_SECONDS', 60 * 60))
+
+
+class Notification(models.Model):
+    """A mail waiting in the outbox until flush_notifications sends it in a digest."""
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sent_at', 'created_at'], name='notification_outbox_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {self.recipient}"
@@ -0,0 +1,114 @@
+"""
+Mail outbox.
+
+Download runs only append Notification rows with notify(); they never wait on
+the mail API. flush_notifications, run by the `flush_notifications` command and
+by `run_worker` when idle, merges the pending rows of each recipient into one
+digest once the oldest of them is NOTIFY_DIGEST_WINDOW seconds old, and sends
+every digest in a single Mailjet batch request. Failed sends are retried with
+a doubling delay.
+"""
+import datetime
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from mailjet_rest import Client
+
+from backoffice.models import Notification
+
+logger = logging.getLogger(__name__)
+
+# Seconds a flusher holds the rows it is sending
+SEND_LEASE = 5 * 60
+
+
+def notify(subject, body, recipients=None):
+    """Queue a mail to `recipients` (settings.TO_EMAIL by default)."""
+    recipients = recipients or settings.TO_EMAIL
+    return Notification.objects.bulk_create([
+        Notification(recipient=recipient, subject=subject, body=body) for recipient in recipients
+    ])
+
+
+def flush_notifications(now=None, force=False):
+    """
+    Send the digests that are due, `force` ignoring the digest window.
+    Returns the number of digests sent.
+    """
+    now = now or timezone.now()
+    window = datetime.timedelta(seconds=getattr(settings, "NOTIFY_DIGEST_WINDOW", 15 * 60))
+    pending = Notification.objects.filter(
+        Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now),
+        sent_at__isnull=True,
+        attempts__lt=getattr(settings, "NOTIFY_MAX_ATTEMPTS", 10),
+    )
+    with transaction.atomic():
+        # Concurrent flushers skip each other's rows instead of sending them twice
+        rows = list(pending.select_for_update(skip_locked=True).order_by('created_at', 'pk'))
+        by_recipient = {}
+        for row in rows:
+            by_recipient.setdefault(row.recipient, []).append(row)
+        due = {
+            recipient: group for recipient, group in by_recipient.items()
+            if force or group[0].created_at <= now - window
+        }
+        if not due:
+            return 0
+        ids = [row.pk for group in due.values() for row in group]
+        # Claim the rows so the row locks are not held during the Mailjet call;
+        # a flusher that dies before sending leaves them to be retried after SEND_LEASE
+        Notification.objects.filter(pk__in=ids).update(
+            next_attempt_at=now + datetime.timedelta(seconds=SEND_LEASE))
+    try:
+        send_messages([digest_message(recipient, group) for recipient, group in due.items()])
+    except Exception as exc:
+        logger.error(f"Failed to send {len(due)} digest(s): {exc}")
+        attempts = max(row.attempts for group in due.values() for row in group) + 1
+        Notification.objects.filter(pk__in=ids).update(
+            attempts=F('attempts') + 1,
+            next_attempt_at=now + datetime.timedelta(seconds=retry_delay(attempts)),
+            error=str(exc),
+        )
+        return 0
+    Notification.objects.filter(pk__in=ids).update(sent_at=now, next_attempt_at=None, error='')
+    logger.info(f"Sent {len(due)} digest(s) of {len(ids)} notification(s)")
+    return len(due)
+
+
+def retry_delay(attempts):
+    """Seconds before retrying a digest that failed `attempts` times."""
+    base = getattr(settings, "NOTIFY_RETRY_BASE", 60)
+    return min(base * 2 ** (attempts - 1), getattr(settings, "NOTIFY_RETRY_MAX", 60 * 60))
+
+
+def digest_message(recipient, notifications):
+    """Build the Mailjet message merging `notifications` for `recipient`."""
+    if len(notifications) == 1:
+        subject, body = notifications[0].subject, notifications[0].body
+    else:
+        subject = f"{notifications[0].subject} ({len(notifications)} runs)"
+        body = "\r\n".join(
+            f"--- {timezone.localtime(notification.created_at):%Y-%m-%d %H:%M} ---\r\n{notification.body}"
+            for notification in notifications
+        )
+    return {
+        "From": {
+            "Email": settings.FROM_EMAIL,
+        },
+        "To": [{"Email": recipient}],
+        "Subject": subject,
+        "TextPart": body,
+        "CustomID": "FetcherNotification",
+    }
+
+
+def send_messages(messages):
+    """Send `messages` in one Mailjet request; raise if Mailjet does not accept them."""
+    mailjet = Client(auth=(settings.MAILJET_API_KEY, settings.MAILJET_API_SECRET), version='v3.1')
+    result = mailjet.send.create(data={'Messages': messages})
+    if result.status_code != 200:
+        raise RuntimeError(f"Mailjet answered {result.status_code}: {result.text}")
+    return result
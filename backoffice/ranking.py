@@ -0,0 +1,76 @@
+"""
+Local ranking of tracker search results.
+
+lookup fetches the broad result set for an episode once and picks the best
+release here: language first, then resolution, with title similarity and
+seeders only breaking ties. Keeping the rule local makes it testable offline.
+A name with a season token only ("Show S01") asks for a season pack.
+"""
+import difflib
+import re
+
+LANGUAGE_WEIGHT = 4
+RESOLUTION_WEIGHT = 2
+
+_EPISODE_TOKEN = re.compile(r"^s\d{1,2}e\d{1,3}$")
+_SEASON_TOKEN = re.compile(r"^s(\d{1,2})$")
+
+
+def tokenize(text):
+    """Lowercase `text` and split it on anything that is not a letter or a digit."""
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).split()
+
+
+def score_torrent(torrent, name, language, resolution):
+    """
+    Score a search result for the episode `name` ("Show S01E02"), or the
+    season pack `name` ("Show S01"). Returns None when the result is not a
+    candidate: no seeders, a title missing the SxxEyy token of `name`, or
+    a title that is not a pack of the asked season.
+    """
+    if torrent.get("seeders", 0) <= 0:
+        return None
+    name_tokens = tokenize(name)
+    title_tokens = tokenize(torrent.get("title", ""))
+    episode = next((token for token in name_tokens if _EPISODE_TOKEN.match(token)), None)
+    season = next((int(match.group(1)) for match in map(_SEASON_TOKEN.match, name_tokens) if match), None)
+    if episode and episode not in title_tokens:
+        return None
+    if not episode and season is not None and pack_coverage(torrent.get("title", ""), season) is None:
+        return None
+
+    score = 0.0
+    if language and language.lower() in title_tokens:
+        score += LANGUAGE_WEIGHT
+    if resolution and resolution.lower() in title_tokens:
+        score += RESOLUTION_WEIGHT
+    # Tie-breakers, together always below the smallest weight
+    similarity = difflib.SequenceMatcher(None, " ".join(name_tokens), " ".join(title_tokens)).ratio()
+    popularity = torrent["seeders"] / (torrent["seeders"] + 50)
+    return score + (similarity + popularity) / 2.5
+
+
+def pack_coverage(title, season):
+    """
+    Episodes of `season` held by the pack `title`, as (first, last) with last
+    None for the whole season; None when `title` is not a pack of `season`.
+    """
+    ranged = re.search(rf"(?<![a-z0-9])s0?{season}e(\d{{1,3}})-e?(\d{{1,3}})(?![0-9])", title.lower())
+    if ranged:
+        return int(ranged.group(1)), int(ranged.group(2))
+    tokens = tokenize(title)
+    if any(_EPISODE_TOKEN.match(token) for token in tokens):
+        return None
+    if any(int(match.group(1)) == season for match in map(_SEASON_TOKEN.match, tokens) if match):
+        return 1, None
+    return None
+
+
+def pick_best(torrents, name, language, resolution):
+    """Return the best scored torrent of `torrents`, or None if none is a candidate."""
+    best, best_score = None, None
+    for torrent in torrents:
+        score = score_torrent(torrent, name, language, resolution)
+        if score is not None and (best_score is None or score > best_score):
+            best, best_score = torrent, score
+    return best
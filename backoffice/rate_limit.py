@@ -0,0 +1,92 @@
+"""
+Token-bucket rate limiting shared across processes.
+
+Buckets are kept in the RATE_LIMIT_CACHE_ALIAS cache, keyed by upstream host,
+so cron, admin views and workers draw from the same tokens as long as that
+cache is shared by them (Redis, Memcached or the database cache; a LocMemCache
+only covers one process). A bucket is read and written under a short lock
+taken with cache.add, which is atomic on those backends.
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+LOCK_TIMEOUT = 5
+LOCK_POLL = 0.005
+
+
+class TokenBucket:
+    """
+    `rate` tokens per second, holding at most `capacity` tokens.
+    A caller that finds the bucket empty reserves the next token anyway and
+    sleeps until it is due, so concurrent callers queue up fairly.
+    """
+
+    def __init__(self, key, rate, capacity=1, cache=None):
+        self.key = f"rate_limit::{key}"
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.cache = cache or caches[getattr(settings, "RATE_LIMIT_CACHE_ALIAS", "default")]
+
+    def reserve(self, now=None):
+        """Take a token and return how many seconds until it may be used."""
+        with self._lock():
+            now = time.time() if now is None else now
+            tokens, stamp = self.cache.get(self.key) or (self.capacity, now)
+            tokens = min(self.capacity, tokens + max(now - stamp, 0) * self.rate) - 1
+            # Keep the state until the bucket would be full again, then it is not needed
+            timeout = (self.capacity - tokens) / self.rate + 1
+            self.cache.set(self.key, (tokens, now), timeout)
+        return max(-tokens / self.rate, 0)
+
+    def acquire(self):
+        """Block until a token is available; return the seconds spent waiting."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def _lock(self):
+        return CacheLock(self.cache, f"{self.key}::lock")
+
+
+class LockTimeout(TimeoutError):
+    """Raised when a CacheLock could not be taken within LOCK_TIMEOUT."""
+
+
+class CacheLock:
+    """Mutex held in `cache` under `key`, across every process sharing the cache."""
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        self.token = uuid.uuid4().hex
+
+    def __enter__(self):
+        # A holder that died leaves the lock to expire after LOCK_TIMEOUT
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while not self.cache.add(self.key, self.token, LOCK_TIMEOUT):
+            if time.monotonic() >= deadline:
+                raise LockTimeout(f"Could not take {self.key} within {LOCK_TIMEOUT}s")
+            time.sleep(LOCK_POLL)
+        return self
+
+    def __exit__(self, *exc_info):
+        # Past LOCK_TIMEOUT the lock may have expired and been taken by someone else
+        if self.cache.get(self.key) == self.token:
+            self.cache.delete(self.key)
+
+
+def bucket_for(host):
+    """
+    Return the bucket of `host` from settings.HTTP_RATE_LIMITS, or None when
+    the host is not limited. A limit is a rate in requests per second, or a
+    (rate, burst) pair.
+    """
+    limit = getattr(settings, "HTTP_RATE_LIMITS", {}).get(host)
+    if not limit:
+        return None
+    rate, capacity = limit if isinstance(limit, (tuple, list)) else (limit, 1)
+    return TokenBucket(host, rate, capacity)
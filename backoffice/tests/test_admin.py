@@ -0,0 +1,146 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from backoffice.circuit_breaker import CircuitBreaker
+from backoffice.models import Show, Episode, ShowStats, Job
+from backoffice.utils import refresh_show_stats
+
+
+class ShowAdminTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(self.user)
+        for show_id in range(1, 21):
+            show = Show.objects.create(tst_id=show_id, name=f"Show {show_id}")
+            for number in range(1, show_id + 1):
+                Episode.objects.create(
+                    tst_id=show_id * 100 + number, show=show, name="", season=1, number=number,
+                    aired=True, watched=False)
+        refresh_show_stats(Show.objects.values_list("pk", flat=True))
+
+    def test_changelist_queries_do_not_grow_with_shows(self):
+        with self.assertNumQueries(6):
+            response = self.client.get("/admin/backoffice/show/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_changelist_sorts_on_stats(self):
+        # Column 3 is "Number of Episode"; sort it descending
+        response = self.client.get("/admin/backoffice/show/", {"o": "-3"})
+        shows = list(response.context["cl"].result_list)
+        self.assertEqual(shows[0].tst_id, 20)
+        self.assertEqual(shows[0].stats.total, 20)
+
+    def test_show_without_stats_displays_zero(self):
+        ShowStats.objects.filter(show_id=1).delete()
+        response = self.client.get("/admin/backoffice/show/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_mark_downloaded_refreshes_stats(self):
+        self.client.post("/admin/backoffice/episode/", {
+            "action": "mark_downloaded_action",
+            "_selected_action": [101, 201, 202],
+        })
+        self.assertEqual(ShowStats.objects.get(show_id=1).to_download, 0)
+        self.assertEqual(ShowStats.objects.get(show_id=2).to_download, 0)
+        self.assertEqual(ShowStats.objects.get(show_id=3).to_download, 3)
+
+
+class EpisodeAdminTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(self.user)
+        show = Show.objects.create(tst_id=1, name="Show", enabled=True)
+        self.pending = Episode.objects.create(
+            tst_id=10, show=show, name="", season=1, number=1, aired=True, watched=False,
+            date=datetime.date(2024, 1, 1))
+        Episode.objects.create(
+            tst_id=11, show=show, name="", season=1, number=2, aired=True, watched=True,
+            date=datetime.date(2024, 1, 2))
+
+    def test_list_to_download_redirects_to_filter(self):
+        response = self.client.get("/admin/list_to_download")
+        self.assertRedirects(response, "/admin/backoffice/episode/?to_download=1", fetch_redirect_response=False)
+
+    def test_to_download_filter(self):
+        response = self.client.get("/admin/backoffice/episode/", {"to_download": "1"})
+        self.assertEqual(list(response.context["cl"].result_list), [self.pending])
+
+    def test_download_action_queues_job(self):
+        response = self.client.post("/admin/backoffice/episode/", {
+            "action": "download_episodes_action",
+            "_selected_action": [self.pending.pk],
+        })
+        self.assertEqual(response.status_code, 302)
+        job = Job.objects.get()
+        self.assertEqual((job.kind, job.status, job.user), ("download_episodes", Job.QUEUED, self.user))
+        self.assertEqual(job.params, {"episode_ids": [self.pending.pk]})
+
+
+    def test_change_form_refreshes_stats(self):
+        refresh_show_stats([1])
+        data = {"name": "", "date": "2024-01-01", "number": 1, "show": 1, "season": 1, "tst_id": 10,
+                "aired": "on", "watched": "on", "lookup_attempts": 0}
+        response = self.client.post(f"/admin/backoffice/episode/{self.pending.pk}/change/", data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(ShowStats.objects.get(show_id=1).to_watch, 0)
+
+    def test_delete_refreshes_stats(self):
+        refresh_show_stats([1])
+        self.client.post(f"/admin/backoffice/episode/{self.pending.pk}/delete/", {"post": "yes"})
+        self.assertEqual(ShowStats.objects.get(show_id=1).total, 1)
+        self.client.post("/admin/backoffice/episode/", {
+            "action": "delete_selected", "_selected_action": [11], "post": "yes",
+        })
+        self.assertEqual(ShowStats.objects.get(show_id=1).total, 0)
+
+
+class JobViewsTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(self.user)
+
+    def test_fetch_show_view_queues_job(self):
+        response = self.client.get("/admin/fetch_show")
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Job.objects.get().params, {"enabled": True})
+
+    def test_download_url_shows_job_result(self):
+        response = self.client.post("/admin/download-url/", {"urls": '["https://example.com/show/s01e01"]'})
+        job = Job.objects.get(kind="download_urls")
+        self.assertRedirects(response, f"/admin/download-url/?job={job.pk}", fetch_redirect_response=False)
+        Job.objects.filter(pk=job.pk).update(status=Job.DONE, result={
+            "https://example.com/show/s01e01": "Show.S01E01", "https://example.com/nope": False})
+        response = self.client.get(f"/admin/download-url/?job={job.pk}")
+        self.assertContains(response, "https://example.com/show/s01e01: Show.S01E01")
+        self.assertContains(response, "https://example.com/nope: not downloaded")
+
+    def test_download_url_ignores_invalid_job(self):
+        response = self.client.get("/admin/download-url/?job=abc")
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context["job"])
+
+    def test_job_changelist(self):
+        Job.objects.create(kind="get_shows")
+        self.assertEqual(self.client.get("/admin/backoffice/job/").status_code, 200)
+
+
+@override_settings(CIRCUIT_BREAKER_THRESHOLD=1)
+class CircuitBreakersViewTest(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.user = get_user_model().objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(self.user)
+
+    def test_lists_upstream_breakers(self):
+        CircuitBreaker("test-ygg.example.com").record_failure()
+        response = self.client.get("/admin/circuit_breakers")
+        states = {breaker["host"]: breaker["state"] for breaker in response.context["breakers"]}
+        self.assertEqual(states, {"test-api.example.com": "closed", "test-ygg.example.com": "open"})
+
+    def test_reset(self):
+        CircuitBreaker("test-ygg.example.com").record_failure()
+        self.client.post("/admin/circuit_breakers", {"host": "test-ygg.example.com"})
+        self.assertEqual(CircuitBreaker("test-ygg.example.com").status()["state"], "closed")
@@ -0,0 +1,48 @@
+from django.contrib.admin.models import LogEntry, ADDITION, CHANGE
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+
+from backoffice.audit import AuditBuffer
+from backoffice.models import Show
+
+
+class AuditBufferTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("admin")
+        self.shows = [Show.objects.create(tst_id=i, name=f"Show {i}") for i in range(1, 6)]
+        ContentType.objects.get_for_model(Show)
+
+    def test_flushes_every_batch_and_at_exit(self):
+        with AuditBuffer(self.user, batch_size=2) as audit:
+            # One INSERT per two entries, the content type comes from the cache
+            with self.assertNumQueries(2):
+                for show in self.shows[:4]:
+                    audit.log(show, ADDITION, "Created")
+            audit.log(self.shows[4], CHANGE, "Updated")
+            self.assertEqual(LogEntry.objects.count(), 4)
+        self.assertEqual(LogEntry.objects.count(), 5)
+        self.assertEqual(set(LogEntry.objects.values_list("user_id", flat=True)), {self.user.pk})
+
+    def test_rolled_back_block_drops_its_entries(self):
+        with AuditBuffer(self.user) as audit:
+            audit.log(self.shows[0], CHANGE, "Kept")
+            with self.assertRaises(ValueError):
+                with audit.atomic():
+                    Show.objects.filter(pk=2).update(name="Renamed")
+                    audit.log(self.shows[1], CHANGE, "Renamed")
+                    raise ValueError
+        self.assertEqual(list(LogEntry.objects.values_list("change_message", flat=True)), ["Kept"])
+        self.assertEqual(Show.objects.get(pk=2).name, "Show 2")
+
+    def test_no_flush_inside_atomic_block(self):
+        with AuditBuffer(self.user, batch_size=2) as audit:
+            with audit.atomic():
+                for show in self.shows:
+                    audit.log(show, ADDITION, "Created")
+                self.assertEqual(LogEntry.objects.count(), 0)
+            self.assertEqual(LogEntry.objects.count(), 5)
+
+    def test_defaults_to_audit_user(self):
+        with AuditBuffer() as audit:
+            self.assertEqual(audit.user_id, 1)
@@ -1,10 +1,13 @@
+import datetime
 from io import StringIO
 from unittest.mock import patch
 
 from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
 
-from backoffice.models import Show, Episode
+from backoffice.jobs import enqueue
+from backoffice.models import Show, Episode, ShowSyncState, Job
 
 
 class GetShowsCommandTest(TestCase):
@@ -27,27 +30,84 @@ class FetchShowCommandTest(TestCase):
     def setUp(self):
         self.show = Show.objects.create(tst_id=1, name="Show")
 
-    @patch("backoffice.management.commands.fetch_show.fetch_show")
-    def test_fetch_show_by_id(self, mock_fetch_show):
+    @staticmethod
+    def _succeed(shows, workers=1, force=False):
+        return [(show, None) for show in shows]
+
+    @patch("backoffice.management.commands.fetch_show.http_client.wait_times")
+    @patch("backoffice.management.commands.fetch_show.fetch_shows")
+    def test_fetch_show_reports_rate_limit_waits(self, mock_fetch_shows, mock_wait_times):
+        mock_fetch_shows.side_effect = self._succeed
+        mock_wait_times.return_value = {"api.example.com": 2.5}
+        out = StringIO()
+        call_command("fetch_show", "1", stdout=out)
+        self.assertIn("Waited 2.5s on the api.example.com rate limit", out.getvalue())
+
+    @patch("backoffice.management.commands.fetch_show.fetch_shows")
+    def test_fetch_show_by_id(self, mock_fetch_shows):
+        mock_fetch_shows.side_effect = self._succeed
         out = StringIO()
         call_command("fetch_show", "1", stdout=out)
-        mock_fetch_show.assert_called_once_with(self.show)
+        mock_fetch_shows.assert_called_once()
+        self.assertEqual(list(mock_fetch_shows.call_args[0][0]), [self.show])
         self.assertIn("Successfully fetch", out.getvalue())
 
-    @patch("backoffice.management.commands.fetch_show.fetch_show")
-    def test_fetch_show_all(self, mock_fetch_show):
+    @patch("backoffice.management.commands.fetch_show.fetch_shows")
+    def test_fetch_show_all(self, mock_fetch_shows):
+        mock_fetch_shows.side_effect = self._succeed
         out = StringIO()
         call_command("fetch_show", "--all", stdout=out)
-        mock_fetch_show.assert_called()
-        self.assertEqual(mock_fetch_show.call_count, 1)
+        mock_fetch_shows.assert_called_once()
+        self.assertEqual(out.getvalue().count("Successfully fetch"), 1)
 
-    @patch("backoffice.management.commands.fetch_show.fetch_show")
-    def test_fetch_show_enabled(self, mock_fetch_show):
+    @patch("backoffice.management.commands.fetch_show.fetch_shows")
+    def test_fetch_show_enabled(self, mock_fetch_shows):
+        mock_fetch_shows.side_effect = self._succeed
+        Show.objects.create(tst_id=2, name="Disabled")
         self.show.enabled = True
         self.show.save()
         out = StringIO()
         call_command("fetch_show", "--enabled", stdout=out)
-        mock_fetch_show.assert_called_once_with(self.show)
+        self.assertEqual(list(mock_fetch_shows.call_args[0][0]), [self.show])
+
+    @patch("backoffice.management.commands.fetch_show.fetch_shows")
+    def test_fetch_show_due(self, mock_fetch_shows):
+        mock_fetch_shows.side_effect = self._succeed
+        self.show.enabled = True
+        self.show.save()
+        checked = Show.objects.create(tst_id=2, name="Checked", enabled=True)
+        ShowSyncState.objects.create(show=checked, next_check_at=timezone.now() + datetime.timedelta(days=1))
+        call_command("fetch_show", "--due", stdout=StringIO())
+        self.assertEqual(list(mock_fetch_shows.call_args[0][0]), [self.show])
+
+    @patch("backoffice.management.commands.fetch_show.fetch_shows")
+    def test_fetch_show_workers(self, mock_fetch_shows):
+        mock_fetch_shows.side_effect = self._succeed
+        call_command("fetch_show", "--all", "--workers", "8", stdout=StringIO())
+        self.assertEqual(mock_fetch_shows.call_args[1]["workers"], 8)
+
+    @patch("backoffice.management.commands.fetch_show.fetch_shows")
+    def test_fetch_show_force(self, mock_fetch_shows):
+        mock_fetch_shows.side_effect = self._succeed
+        call_command("fetch_show", "--all", "--force", stdout=StringIO())
+        self.assertTrue(mock_fetch_shows.call_args[1]["force"])
+
+    @patch("backoffice.management.commands.fetch_show.fetch_shows")
+    def test_fetch_show_raises_command_error_on_exception(self, mock_fetch_shows):
+        mock_fetch_shows.return_value = [(self.show, Exception("API error"))]
+        from django.core.management.base import CommandError
+        with self.assertRaises(CommandError):
+            call_command("fetch_show", "1", stdout=StringIO(), stderr=StringIO())
+
+    @patch("backoffice.management.commands.fetch_show.fetch_shows")
+    def test_fetch_show_continues_after_failure(self, mock_fetch_shows):
+        other = Show.objects.create(tst_id=2, name="Other")
+        mock_fetch_shows.return_value = [(self.show, Exception("API error")), (other, None)]
+        out = StringIO()
+        from django.core.management.base import CommandError
+        with self.assertRaisesMessage(CommandError, "Failed to fetch 1 show(s): Show"):
+            call_command("fetch_show", "--all", stdout=out, stderr=StringIO())
+        self.assertIn("Successfully fetch Other", out.getvalue())
 
 
 class DownloadEpisodeCommandTest(TestCase):
@@ -64,19 +124,53 @@ class DownloadEpisodeCommandTest(TestCase):
             downloaded=False,
         )
 
-    @patch("backoffice.management.commands.download_episode.download_episode")
-    def test_download_episode_by_id(self, mock_download_episode):
+    @patch("backoffice.management.commands.download_episode.download_queue")
+    def test_download_episode_by_id(self, mock_download_queue):
         out = StringIO()
         call_command("download_episode", "10", stdout=out)
-        mock_download_episode.assert_called_once()
-        qs = mock_download_episode.call_args[0][0]
+        mock_download_queue.assert_called_once()
+        qs = mock_download_queue.call_args[0][0]
         self.assertEqual(qs.count(), 1)
         self.assertEqual(qs.get().pk, 10)
 
-    @patch("backoffice.management.commands.download_episode.download_episode")
-    def test_download_episode_to_watch(self, mock_download_episode):
+    @patch("backoffice.management.commands.download_episode.download_queue")
+    def test_download_episode_to_watch(self, mock_download_queue):
         out = StringIO()
         call_command("download_episode", "--to-watch", stdout=out)
-        mock_download_episode.assert_called_once()
-        qs = mock_download_episode.call_args[0][0]
+        mock_download_queue.assert_called_once()
+        qs = mock_download_queue.call_args[0][0]
         self.assertTrue(qs.filter(show__enabled=True, watched=False, downloaded=False, aired=True).exists() or qs.count() == 0)
+
+
+class BenchmarkDownloadQueueCommandTest(TestCase):
+    def test_benchmark_reports_each_size_and_rolls_back(self):
+        out = StringIO()
+        call_command("benchmark_download_queue", "--sizes", "50", "200", "--pending", "10", "--repeat", "1", stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(any(line.split()[:1] == ["50"] for line in lines))
+        self.assertTrue(any(line.split()[:1] == ["200"] for line in lines))
+        self.assertIn("episode_to_download_idx", out.getvalue())
+        self.assertEqual(Episode.objects.count(), 0)
+        self.assertEqual(Show.objects.count(), 0)
+
+
+class RunWorkerCommandTest(TestCase):
+    @patch("backoffice.management.commands.run_worker.flush_notifications")
+    @patch("backoffice.jobs.get_shows")
+    def test_run_worker_once_drains_queue(self, mock_get_shows, mock_flush):
+        job = enqueue("get_shows")
+        out = StringIO()
+        call_command("run_worker", "--once", stdout=out)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertIn(f"Successfully ran job {job}", out.getvalue())
+        mock_flush.assert_called_once()
+
+
+class FlushNotificationsCommandTest(TestCase):
+    @patch("backoffice.management.commands.flush_notifications.flush_notifications", return_value=2)
+    def test_flush_notifications(self, mock_flush):
+        out = StringIO()
+        call_command("flush_notifications", "--force", stdout=out)
+        mock_flush.assert_called_once_with(force=True)
+        self.assertIn("Sent 2 digest(s)", out.getvalue())
@@ -0,0 +1,172 @@
+from unittest.mock import patch
+
+import requests
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from backoffice import http_client
+from backoffice.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from backoffice.rate_limit import CacheLock, LockTimeout, TokenBucket, bucket_for
+
+
+class SessionTest(TestCase):
+    def tearDown(self):
+        http_client.reset_session()
+
+    @override_settings(HTTP_POOL_CONNECTIONS=3, HTTP_POOL_MAXSIZE=7, HTTP_RETRIES=5, HTTP_BACKOFF_FACTOR=2)
+    def test_session_built_from_settings(self):
+        http_client.reset_session()
+        adapter = http_client.get_session().get_adapter("https://api.example.com")
+        self.assertEqual(adapter._pool_connections, 3)
+        self.assertEqual(adapter._pool_maxsize, 7)
+        self.assertEqual(adapter.max_retries.total, 5)
+        self.assertEqual(adapter.max_retries.backoff_factor, 2)
+        self.assertIn(429, adapter.max_retries.status_forcelist)
+        self.assertIn(503, adapter.max_retries.status_forcelist)
+
+    def test_session_is_shared(self):
+        self.assertIs(http_client.get_session(), http_client.get_session())
+
+
+class GetTest(TestCase):
+    @override_settings(HTTP_CONNECT_TIMEOUT=2, HTTP_READ_TIMEOUT=9)
+    @patch("backoffice.http_client.get_session")
+    def test_default_timeout_applied(self, mock_session):
+        mock_session.return_value.get.return_value.status_code = 200
+        http_client.get("https://api.example.com/x", params={"a": 1})
+        mock_session.return_value.get.assert_called_once_with(
+            "https://api.example.com/x", params={"a": 1}, timeout=(2, 9))
+
+    @patch("backoffice.http_client.get_session")
+    def test_explicit_timeout_kept(self, mock_session):
+        mock_session.return_value.get.return_value.status_code = 200
+        http_client.get("https://api.example.com/x", timeout=1)
+        self.assertEqual(mock_session.return_value.get.call_args[1]["timeout"], 1)
+
+
+@override_settings(CIRCUIT_BREAKER_THRESHOLD=2, CIRCUIT_BREAKER_COOLDOWN=30)
+class CircuitBreakerTest(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+
+    @patch("backoffice.http_client.get_session")
+    def test_get_opens_breaker_and_fails_fast(self, mock_session):
+        mock_session.return_value.get.side_effect = requests.ConnectionError("down")
+        for _ in range(2):
+            with self.assertRaises(requests.ConnectionError):
+                http_client.get("https://api.example.com/x")
+        with self.assertRaises(CircuitOpenError):
+            http_client.get("https://api.example.com/x")
+        self.assertEqual(mock_session.return_value.get.call_count, 2)
+        # Other hosts are not affected
+        mock_session.return_value.get.side_effect = None
+        mock_session.return_value.get.return_value.status_code = 200
+        http_client.get("https://other.example.com/x")
+
+    @patch("backoffice.http_client.get_session")
+    def test_server_errors_count_and_success_resets(self, mock_session):
+        response = mock_session.return_value.get.return_value
+        response.status_code = 503
+        http_client.get("https://api.example.com/x")
+        self.assertEqual(CircuitBreaker("api.example.com").status()["failures"], 1)
+        response.status_code = 404
+        http_client.get("https://api.example.com/x")
+        self.assertEqual(CircuitBreaker("api.example.com").status()["failures"], 0)
+
+    def test_half_open_lets_one_probe_through(self):
+        breaker = CircuitBreaker("api.example.com")
+        breaker.record_failure(now=100)
+        breaker.record_failure(now=100)
+        self.assertEqual(breaker.status(now=110)["state"], OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call(now=110)
+        self.assertEqual(breaker.status(now=131)["state"], HALF_OPEN)
+        breaker.before_call(now=131)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call(now=131)
+        # A failed probe opens the breaker for a new cooldown
+        breaker.record_failure(now=131)
+        self.assertEqual(breaker.status(now=140)["state"], OPEN)
+        breaker.before_call(now=162)
+        breaker.record_success()
+        self.assertEqual(breaker.status(now=162)["state"], CLOSED)
+
+
+class HostSlotTest(TestCase):
+    def test_same_host_shares_slot(self):
+        self.assertIs(
+            http_client.host_slot("https://api.example.com/a"),
+            http_client.host_slot("https://api.example.com/b?q=1"),
+        )
+        self.assertIsNot(
+            http_client.host_slot("https://api.example.com/a"),
+            http_client.host_slot("https://other.example.com/a"),
+        )
+
+
+class ThrottleTest(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        http_client.wait_times(reset=True)
+
+    @override_settings(HTTP_RATE_LIMITS={"api.example.com": 10})
+    @patch("backoffice.rate_limit.time.sleep")
+    def test_requests_are_spaced_per_host(self, mock_sleep):
+        self.assertEqual(http_client.throttle("https://api.example.com/a"), 0)
+        waited = http_client.throttle("https://api.example.com/b")
+        self.assertAlmostEqual(waited, 0.1, places=2)
+        mock_sleep.assert_called_once()
+        self.assertEqual(http_client.throttle("https://other.example.com/a"), 0)
+        self.assertAlmostEqual(http_client.wait_times()["api.example.com"], 0.1, places=2)
+
+    @override_settings(HTTP_RATE_LIMITS={})
+    @patch("backoffice.rate_limit.time.sleep")
+    def test_unlimited_host(self, mock_sleep):
+        for _ in range(3):
+            self.assertEqual(http_client.throttle("https://api.example.com/a"), 0)
+        mock_sleep.assert_not_called()
+        self.assertEqual(http_client.wait_times(), {})
+
+
+class TokenBucketTest(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+
+    def test_burst_then_rate(self):
+        bucket = TokenBucket("host", rate=2, capacity=3)
+        waits = [bucket.reserve(now=100) for _ in range(5)]
+        self.assertEqual(waits, [0, 0, 0, 0.5, 1.0])
+        # Two seconds later the two reservations are paid back and 2 tokens refilled
+        self.assertEqual(bucket.reserve(now=102), 0)
+
+    def test_bucket_does_not_overfill(self):
+        bucket = TokenBucket("host", rate=1, capacity=2)
+        bucket.reserve(now=0)
+        self.assertEqual([bucket.reserve(now=1000) for _ in range(3)], [0, 0, 1.0])
+
+    def test_state_is_shared_through_the_cache(self):
+        TokenBucket("host", rate=1).reserve(now=10)
+        self.assertEqual(TokenBucket("host", rate=1).reserve(now=10), 1.0)
+
+    @patch("backoffice.rate_limit.LOCK_TIMEOUT", 0.01)
+    def test_lock_times_out_instead_of_running_unlocked(self):
+        cache = caches["default"]
+        cache.add("lock", "holder", 60)
+        with self.assertRaises(LockTimeout):
+            with CacheLock(cache, "lock"):
+                pass
+        self.assertEqual(cache.get("lock"), "holder")
+
+    def test_lock_only_released_by_its_holder(self):
+        cache = caches["default"]
+        with CacheLock(cache, "lock"):
+            # The lock expired and another caller took it
+            cache.set("lock", "other-token")
+        self.assertEqual(cache.get("lock"), "other-token")
+
+    @override_settings(HTTP_RATE_LIMITS={"a.example.com": 5, "b.example.com": (2, 10)})
+    def test_bucket_for_settings(self):
+        self.assertEqual((bucket_for("a.example.com").rate, bucket_for("a.example.com").capacity), (5, 1))
+        self.assertEqual((bucket_for("b.example.com").rate, bucket_for("b.example.com").capacity), (2, 10))
+        self.assertIsNone(bucket_for("c.example.com"))
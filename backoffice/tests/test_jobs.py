@@ -0,0 +1,84 @@
+import datetime
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from backoffice.jobs import enqueue, claim_next_job, run_job, run_pending_jobs
+from backoffice.models import Job, Show, Episode
+
+
+class JobQueueTest(TestCase):
+    def test_enqueue_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            enqueue("nope")
+
+    def test_claim_oldest_first_and_only_once(self):
+        first = enqueue("get_shows")
+        second = enqueue("get_shows")
+        self.assertEqual(claim_next_job().pk, first.pk)
+        self.assertEqual(claim_next_job().pk, second.pk)
+        self.assertIsNone(claim_next_job())
+        self.assertEqual(Job.objects.filter(status=Job.RUNNING).count(), 2)
+
+    def test_lost_running_job_fails(self):
+        lost = enqueue("get_shows")
+        claim_next_job()
+        Job.objects.filter(pk=lost.pk).update(claimed_until=timezone.now() - datetime.timedelta(seconds=1))
+        running = enqueue("get_shows")
+        claim_next_job()
+        queued = enqueue("get_shows")
+        self.assertEqual(claim_next_job().pk, queued.pk)
+        lost.refresh_from_db()
+        self.assertEqual(lost.status, Job.FAILED)
+        self.assertIn("worker", lost.error)
+        self.assertIsNotNone(lost.finished_at)
+        self.assertEqual(Job.objects.get(pk=running.pk).status, Job.RUNNING)
+
+    @override_settings(JOB_LEASE_SECONDS=60)
+    def test_progress_renews_lease(self):
+        enqueue("get_shows")
+        job = claim_next_job()
+        Job.objects.filter(pk=job.pk).update(claimed_until=timezone.now())
+        job.set_progress("1/2 shows")
+        self.assertGreater(Job.objects.get(pk=job.pk).claimed_until, timezone.now() + datetime.timedelta(seconds=50))
+
+    @patch("backoffice.jobs.get_shows")
+    def test_run_job_stores_result(self, mock_get_shows):
+        enqueue("get_shows")
+        job = run_job(claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.result, {})
+        self.assertIsNotNone(job.finished_at)
+        mock_get_shows.assert_called_once()
+
+    @patch("backoffice.jobs.get_shows", side_effect=Exception("API down"))
+    def test_run_job_stores_error(self, mock_get_shows):
+        enqueue("get_shows")
+        job = run_job(claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn("API down", job.error)
+
+    @patch("backoffice.jobs.fetch_shows")
+    def test_fetch_shows_job(self, mock_fetch_shows):
+        show = Show.objects.create(tst_id=1, name="Show", enabled=True)
+        Show.objects.create(tst_id=2, name="Other", enabled=False)
+        mock_fetch_shows.side_effect = lambda shows, **kwargs: ((s, None) for s in shows)
+        job = enqueue("fetch_shows", enabled=True)
+        self.assertEqual(run_pending_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.result, {str(show): True})
+        self.assertEqual(job.progress, "1/1 shows")
+
+    @patch("backoffice.jobs.download_queue")
+    def test_download_episodes_job(self, mock_download_queue):
+        show = Show.objects.create(tst_id=1, name="Show", enabled=True)
+        episode = Episode.objects.create(tst_id=10, show=show, name="", season=1, number=1, aired=True, watched=False)
+        mock_download_queue.return_value = {episode: True}
+        job = enqueue("download_episodes", episode_ids=[episode.pk])
+        run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.result, {str(episode): True})
+        self.assertEqual(list(mock_download_queue.call_args[0][0]), [episode])
@@ -0,0 +1,52 @@
+import json
+
+from django.test import SimpleTestCase
+
+from backoffice.json_stream import iter_array_items
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class IterArrayItemsTest(SimpleTestCase):
+    def setUp(self):
+        self.document = {
+            "id": 12345,
+            "name": 'user "quoted" [not an array] {',
+            "lists": {"shows": ["decoy"]},
+            "shows": [{"id": i, "name": f"Café {i}"} for i in range(50)],
+            "after": True,
+        }
+        self.raw = json.dumps(self.document, ensure_ascii=False).encode()
+
+    def test_items_match_full_parse_for_any_chunk_size(self):
+        for size in (1, 2, 7, 64, len(self.raw)):
+            with self.subTest(size=size):
+                items = list(iter_array_items(chunked(self.raw, size), "shows"))
+                self.assertEqual(items, self.document["shows"])
+
+    def test_numbers_split_across_chunks(self):
+        raw = b'{"shows": [12345, 678]}'
+        self.assertEqual(list(iter_array_items(chunked(raw, 3), "shows")), [12345, 678])
+
+    def test_str_chunks(self):
+        self.assertEqual(list(iter_array_items(['{"shows": [1', ', 2]}'], "shows")), [1, 2])
+
+    def test_missing_key_or_empty_array(self):
+        self.assertEqual(list(iter_array_items([b'{"other": 1}'], "shows")), [])
+        self.assertEqual(list(iter_array_items([b'{"shows": []}'], "shows")), [])
+        self.assertEqual(list(iter_array_items([b'{}'], "shows")), [])
+
+    def test_items_are_yielded_lazily(self):
+        def chunks():
+            yield b'{"shows": [{"id": 1}, '
+            raise AssertionError("read too far")
+
+        self.assertEqual(next(iter_array_items(chunks(), "shows")), {"id": 1})
+
+    def test_invalid_document(self):
+        with self.assertRaises(ValueError):
+            list(iter_array_items([b"<html>"], "shows"))
+        with self.assertRaises(ValueError):
+            list(iter_array_items([b'{"shows": [1, 2'], "shows"))
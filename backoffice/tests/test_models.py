@@ -1,6 +1,9 @@
 import datetime
+from unittest.mock import patch
 
+from django.db import DatabaseError, connection
 from django.test import TestCase
+from django.utils import timezone
 
 from backoffice.models import Show, Episode
 
@@ -81,3 +84,102 @@ class EpisodeModelTest(TestCase):
         )
         self.assertEqual(ep.name, "")
         self.assertEqual(str(ep), "Show S01E03")
+
+
+class EpisodeToDownloadTest(TestCase):
+    def setUp(self):
+        self.show = Show.objects.create(tst_id=20, name="Enabled", enabled=True)
+        self.disabled = Show.objects.create(tst_id=21, name="Disabled")
+        self.today = datetime.date(2024, 6, 1)
+
+    def _episode(self, tst_id, show=None, **kwargs):
+        fields = {"aired": True, "watched": False, "downloaded": False, "date": self.today}
+        fields.update(kwargs)
+        return Episode.objects.create(tst_id=tst_id, show=show or self.show, name="", season=1, number=tst_id, **fields)
+
+    def test_to_download_selection(self):
+        pending = self._episode(1)
+        self._episode(2, watched=True)
+        self._episode(3, downloaded=True)
+        self._episode(4, aired=False)
+        self._episode(5, date=self.today + datetime.timedelta(days=1))
+        self._episode(6, show=self.disabled)
+        self.assertEqual(list(Episode.objects.to_download(self.today)), [pending])
+
+    def test_to_download_uses_index(self):
+        plan = Episode.objects.to_download(self.today).explain()
+        self.assertIn("episode_to_download_idx", plan)
+
+
+class EpisodeClaimTest(TestCase):
+    def setUp(self):
+        show = Show.objects.create(tst_id=30, name="Show", enabled=True)
+        for number in range(1, 5):
+            Episode.objects.create(
+                tst_id=number, show=show, name="", season=1, number=number, aired=True, watched=False,
+                date=datetime.date(2024, 1, number))
+
+    def test_claims_do_not_overlap(self):
+        first = Episode.objects.to_download().claim("host-a", limit=3)
+        second = Episode.objects.to_download().claim("host-b", limit=3)
+        self.assertEqual([e.pk for e in first], [1, 2, 3])
+        self.assertEqual([e.pk for e in second], [4])
+        self.assertFalse(Episode.objects.claim("host-c").exists())
+
+    def test_expired_lease_can_be_claimed(self):
+        now = timezone.now()
+        Episode.objects.claim("host-a", lease=60, now=now)
+        later = now + datetime.timedelta(seconds=61)
+        self.assertEqual(Episode.objects.claim("host-b", now=later).count(), 4)
+
+    def test_release_only_drops_own_leases(self):
+        Episode.objects.filter(pk=1).claim("host-a")
+        Episode.objects.filter(pk=2).claim("host-b")
+        self.assertEqual(Episode.objects.release("host-a"), 1)
+        self.assertEqual(list(Episode.objects.claimable().values_list("pk", flat=True).order_by("pk")), [1, 3, 4])
+
+
+    def _claim_lock_sql(self, **features):
+        statements = []
+
+        def capture(execute, sql, params, many, context):
+            if "FOR UPDATE" in sql:
+                statements.append(sql)
+                raise DatabaseError("not run")
+            return execute(sql, params, many, context)
+
+        with patch.multiple(connection.features, has_select_for_update=True, **features), \
+                connection.execute_wrapper(capture):
+            with self.assertRaises(DatabaseError):
+                Episode.objects.to_download().claim("host-a")
+        return statements[0]
+
+    def test_claim_locks_only_episodes(self):
+        sql = self._claim_lock_sql(has_select_for_update_skip_locked=True, has_select_for_update_of=True)
+        self.assertIn('JOIN "backoffice_show"', sql)
+        self.assertIn('FOR UPDATE OF "backoffice_episode" SKIP LOCKED', sql)
+
+    def test_claim_without_lock_options(self):
+        # MariaDB before 10.6: neither OF nor SKIP LOCKED
+        sql = self._claim_lock_sql(has_select_for_update_skip_locked=False, has_select_for_update_of=False)
+        self.assertTrue(sql.endswith("FOR UPDATE"))
+
+
+class EpisodeEligibleTest(TestCase):
+    def setUp(self):
+        self.show = Show.objects.create(tst_id=40, name="Show", enabled=True)
+        self.now = timezone.now()
+        self.date = datetime.date(2024, 1, 1)
+
+    def _episode(self, tst_id, **kwargs):
+        return Episode.objects.create(
+            tst_id=tst_id, show=self.show, name="", season=1, number=tst_id, aired=True, watched=False,
+            date=self.date, **kwargs)
+
+    def test_eligible_skips_backed_off_episodes(self):
+        never = self._episode(1)
+        over = self._episode(2, next_lookup_at=self.now - datetime.timedelta(minutes=1), lookup_date=self.date)
+        self._episode(3, next_lookup_at=self.now + datetime.timedelta(hours=1), lookup_date=self.date)
+        moved = self._episode(
+            4, next_lookup_at=self.now + datetime.timedelta(hours=1), lookup_date=self.date - datetime.timedelta(days=7))
+        self.assertEqual(list(Episode.objects.eligible(self.now).order_by("pk")), [never, over, moved])
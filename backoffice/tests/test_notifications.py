@@ -0,0 +1,76 @@
+import datetime
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from backoffice.models import Notification
+from backoffice.notifications import notify, flush_notifications, retry_delay
+
+
+@override_settings(TO_EMAIL=["a@example.com", "b@example.com"], NOTIFY_DIGEST_WINDOW=600)
+class FlushNotificationsTest(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+
+    def _age(self, seconds):
+        Notification.objects.update(created_at=self.now - datetime.timedelta(seconds=seconds))
+
+    def test_notify_queues_one_row_per_recipient(self):
+        notify("Download resum", "body")
+        self.assertEqual(sorted(Notification.objects.values_list("recipient", flat=True)), ["a@example.com", "b@example.com"])
+
+    @patch("backoffice.notifications.Client")
+    def test_waits_for_the_digest_window(self, mock_client):
+        notify("Download resum", "first")
+        self._age(60)
+        self.assertEqual(flush_notifications(now=self.now), 0)
+        mock_client.assert_not_called()
+
+    @patch("backoffice.notifications.Client")
+    def test_one_batch_request_with_a_digest_per_recipient(self, mock_client):
+        send = mock_client.return_value.send.create
+        send.return_value.status_code = 200
+        notify("Download resum", "first run")
+        notify("Download resum", "second run")
+        self._age(700)
+        self.assertEqual(flush_notifications(now=self.now), 2)
+        send.assert_called_once()
+        messages = send.call_args[1]["data"]["Messages"]
+        self.assertEqual([m["To"] for m in messages], [[{"Email": "a@example.com"}], [{"Email": "b@example.com"}]])
+        self.assertIn("first run", messages[0]["TextPart"])
+        self.assertIn("second run", messages[0]["TextPart"])
+        self.assertEqual(messages[0]["Subject"], "Download resum (2 runs)")
+        self.assertFalse(Notification.objects.filter(sent_at__isnull=True).exists())
+        self.assertEqual(flush_notifications(now=self.now), 0)
+
+    @patch("backoffice.notifications.send_messages")
+    def test_rows_are_claimed_while_sending(self, mock_send):
+        notify("Download resum", "body")
+        claimed = []
+
+        def send(messages):
+            # A concurrent flusher finds nothing to send while this one is at it
+            claimed.append(flush_notifications(now=self.now, force=True))
+
+        mock_send.side_effect = send
+        self.assertEqual(flush_notifications(now=self.now, force=True), 2)
+        self.assertEqual(claimed, [0])
+        self.assertFalse(Notification.objects.filter(sent_at__isnull=True).exists())
+
+    @patch("backoffice.notifications.Client")
+    def test_failure_is_retried_later(self, mock_client):
+        send = mock_client.return_value.send.create
+        send.return_value = MagicMock(status_code=500, text="down")
+        notify("Download resum", "body")
+        self.assertEqual(flush_notifications(now=self.now, force=True), 0)
+        row = Notification.objects.first()
+        self.assertEqual(row.attempts, 1)
+        self.assertIn("down", row.error)
+        self.assertEqual(row.next_attempt_at, self.now + datetime.timedelta(seconds=retry_delay(1)))
+        # Not retried before its next attempt time
+        self.assertEqual(flush_notifications(now=self.now, force=True), 0)
+        self.assertEqual(send.call_count, 1)
+        send.return_value = MagicMock(status_code=200)
+        later = self.now + datetime.timedelta(seconds=retry_delay(1))
+        self.assertEqual(flush_notifications(now=later, force=True), 2)
@@ -0,0 +1,71 @@
+from django.test import SimpleTestCase
+
+from backoffice.ranking import pack_coverage, pick_best, score_torrent, tokenize
+
+NAME = "My Show S01E02"
+
+
+def torrent(title, seeders=10, torrent_id=None):
+    return {"id": torrent_id or title, "title": title, "seeders": seeders}
+
+
+class TokenizeTest(SimpleTestCase):
+    def test_split_on_separators(self):
+        self.assertEqual(tokenize("My.Show-S01E02 MULTi_1080p"), ["my", "show", "s01e02", "multi", "1080p"])
+
+
+class ScoreTorrentTest(SimpleTestCase):
+    def test_no_seeders_is_not_a_candidate(self):
+        self.assertIsNone(score_torrent(torrent("My.Show.S01E02", seeders=0), NAME, "MULTi", "1080p"))
+
+    def test_other_episode_is_not_a_candidate(self):
+        self.assertIsNone(score_torrent(torrent("My.Show.S01E12.MULTi.1080p"), NAME, "MULTi", "1080p"))
+
+    def test_name_without_episode_token_accepts_any_title(self):
+        self.assertIsNotNone(score_torrent(torrent("My.Movie.2020"), "My Movie", "MULTi", "1080p"))
+
+    def test_tiers_follow_previous_search_order(self):
+        both = score_torrent(torrent("My.Show.S01E02.MULTi.1080p", seeders=1), NAME, "MULTi", "1080p")
+        language = score_torrent(torrent("My.Show.S01E02.MULTi.720p", seeders=5000), NAME, "MULTi", "1080p")
+        resolution = score_torrent(torrent("My.Show.S01E02.VOSTFR.1080p", seeders=5000), NAME, "MULTi", "1080p")
+        neither = score_torrent(torrent("My.Show.S01E02", seeders=5000), NAME, "MULTi", "1080p")
+        self.assertGreater(both, language)
+        self.assertGreater(language, resolution)
+        self.assertGreater(resolution, neither)
+
+
+class PickBestTest(SimpleTestCase):
+    def test_seeders_break_ties(self):
+        torrents = [
+            torrent("My.Show.S01E02.MULTi.1080p.WEB", seeders=3, torrent_id=1),
+            torrent("My.Show.S01E02.MULTi.1080p.WEB", seeders=300, torrent_id=2),
+        ]
+        self.assertEqual(pick_best(torrents, NAME, "MULTi", "1080p")["id"], 2)
+
+    def test_similar_title_breaks_ties(self):
+        torrents = [
+            torrent("Not.My.Show.At.All.S01E02.MULTi.1080p", torrent_id=1),
+            torrent("My.Show.S01E02.MULTi.1080p", torrent_id=2),
+        ]
+        self.assertEqual(pick_best(torrents, NAME, "MULTi", "1080p")["id"], 2)
+
+    def test_no_candidate(self):
+        self.assertIsNone(pick_best([], NAME, "MULTi", "1080p"))
+        self.assertIsNone(pick_best([torrent("My.Show.S01E02", seeders=0)], NAME, "MULTi", "1080p"))
+
+
+class SeasonPackTest(SimpleTestCase):
+    def test_pack_coverage(self):
+        self.assertEqual(pack_coverage("My.Show.S01.MULTi.1080p", 1), (1, None))
+        self.assertEqual(pack_coverage("My.Show.S01E01-E08.MULTi", 1), (1, 8))
+        self.assertEqual(pack_coverage("My_Show_S01E03-08", 1), (3, 8))
+        self.assertIsNone(pack_coverage("My.Show.S01E02.MULTi", 1))
+        self.assertIsNone(pack_coverage("My.Show.S02.MULTi", 1))
+
+    def test_pack_name_only_picks_packs(self):
+        torrents = [
+            torrent("My.Show.S01E02.MULTi.1080p", seeders=900, torrent_id=1),
+            torrent("My.Show.S01.VOSTFR.720p", seeders=5, torrent_id=2),
+            torrent("My.Show.S02.MULTi.1080p", seeders=900, torrent_id=3),
+        ]
+        self.assertEqual(pick_best(torrents, "My Show S01", "MULTi", "1080p")["id"], 2)
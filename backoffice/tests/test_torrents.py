@@ -0,0 +1,82 @@
+import os
+import stat
+import tempfile
+from unittest.mock import MagicMock, patch
+
+import torrent_parser
+from django.test import SimpleTestCase, override_settings
+
+from backoffice.torrents import download_torrent, rewrite_announce, write_atomic
+
+FAKE = "f" * 32
+
+
+def sample_torrent():
+    return torrent_parser.encode({
+        "announce": f"https://tracker.test/{FAKE}/announce",
+        "announce-list": [[f"https://tracker.test/{FAKE}/announce"], ["udp://backup.test:80"]],
+        "comment": f"not rewritten {FAKE}",
+        "info": {
+            "name": "My.Show.S01E01.mkv",
+            "length": 1234,
+            "piece length": 16384,
+            "pieces": "ab" * 20,
+        },
+    })
+
+
+class RewriteAnnounceTest(SimpleTestCase):
+    def test_passkey_replaced_and_info_untouched(self):
+        original = sample_torrent()
+        rewritten = rewrite_announce(original, FAKE, "real_passkey")
+        data = torrent_parser.decode(rewritten)
+        self.assertEqual(data["announce"], "https://tracker.test/real_passkey/announce")
+        self.assertEqual(data["announce-list"], [["https://tracker.test/real_passkey/announce"], ["udp://backup.test:80"]])
+        self.assertEqual(data["comment"], f"not rewritten {FAKE}")
+        info = original[original.index(b"4:info") + 6:-1]
+        self.assertIn(info, rewritten)
+
+    def test_invalid_data(self):
+        with self.assertRaises(ValueError):
+            rewrite_announce(b"<html>", FAKE, "real")
+        with self.assertRaises(ValueError):
+            rewrite_announce(b"d8:announce99:short", FAKE, "real")
+
+
+class DownloadTorrentTest(SimpleTestCase):
+    @patch("backoffice.torrents.http_client.get")
+    def test_download_into_memory(self, mock_get):
+        mock_get.return_value = MagicMock(iter_content=MagicMock(return_value=[b"d3:", b"abc", b"1:xe"]))
+        self.assertEqual(download_torrent("https://ygg.test/t", params={"passkey": FAKE}), b"d3:abc1:xe")
+        self.assertTrue(mock_get.call_args[1]["stream"])
+        mock_get.return_value.close.assert_called_once()
+
+    @override_settings(TORRENT_MAX_SIZE=8)
+    @patch("backoffice.torrents.http_client.get")
+    def test_size_cap(self, mock_get):
+        mock_get.return_value = MagicMock(iter_content=MagicMock(return_value=[b"12345", b"67890"]))
+        with self.assertRaises(ValueError):
+            download_torrent("https://ygg.test/t")
+        mock_get.return_value.close.assert_called_once()
+
+
+class WriteAtomicTest(SimpleTestCase):
+    def test_write_then_rename(self):
+        with tempfile.TemporaryDirectory() as directory:
+            write_atomic(directory, "a.torrent", b"data")
+            self.assertEqual(os.listdir(directory), ["a.torrent"])
+            with open(os.path.join(directory, "a.torrent"), "rb") as file:
+                self.assertEqual(file.read(), b"data")
+
+    def test_file_mode_follows_umask(self):
+        with tempfile.TemporaryDirectory() as directory, patch("backoffice.torrents._UMASK", 0o022):
+            write_atomic(directory, "a.torrent", b"data")
+            mode = stat.S_IMODE(os.stat(os.path.join(directory, "a.torrent")).st_mode)
+        self.assertEqual(mode, 0o644)
+
+    def test_failed_write_leaves_nothing(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with patch("backoffice.torrents.os.replace", side_effect=OSError("disk full")):
+                with self.assertRaises(OSError):
+                    write_atomic(directory, "a.torrent", b"data")
+            self.assertEqual(os.listdir(directory), [])
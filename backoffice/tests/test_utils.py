@@ -1,24 +1,40 @@
 import datetime
+import json
+import os
+import threading
 from unittest.mock import MagicMock, patch
 
+import requests
+
 from django.contrib.admin.models import LogEntry
 from django.contrib.auth import get_user_model
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
-from django.test import TestCase
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
 
-from backoffice.models import Show, Episode
+from backoffice.models import Show, Episode, ShowStats, ShowSyncState
 
 User = get_user_model()
 from backoffice.utils import (
     safe_filename,
     create_or_update_with_log,
+    bulk_create_or_update_with_log,
     get_shows,
     fetch_show,
-    send_mail,
-    print_messages,
+    fetch_shows,
+    compute_next_check,
+    payload_digest,
+    refresh_show_stats,
     download_episode,
+    download_queue,
+    lookup_backoff,
+    record_lookup_misses,
     download_by_urls,
     lookup,
+    search_torrents,
 )
 
 
@@ -79,22 +95,86 @@ class CreateOrUpdateWithLogTest(TestCase):
         self.assertEqual(LogEntry.objects.filter(object_id=obj.pk).count(), 0)
 
 
+class BulkCreateOrUpdateWithLogTest(TestCase):
+    def setUp(self):
+        get_user_model().objects.get_or_create(pk=1, defaults={"username": "testuser"})
+        self.show = Show.objects.create(tst_id=1, name="Show")
+        Episode.objects.create(
+            tst_id=10, show=self.show, name="Old", season=1, number=1, aired=True, watched=False)
+        Episode.objects.create(
+            tst_id=11, show=self.show, name="Same", season=1, number=2, aired=True, watched=False)
+
+    def _defaults(self, name, number):
+        return {
+            "show": self.show,
+            "name": name,
+            "season": 1,
+            "number": number,
+            "watched": False,
+            "date": None,
+            "aired": True,
+        }
+
+    def test_creates_updates_and_logs(self):
+        created, updated = bulk_create_or_update_with_log(Episode, {
+            10: self._defaults("New", 1),
+            11: self._defaults("Same", 2),
+            12: self._defaults("Third", 3),
+        })
+        self.assertEqual([obj.pk for obj in created], [12])
+        self.assertEqual([obj.pk for obj in updated], [10])
+        self.assertEqual(Episode.objects.get(pk=10).name, "New")
+        self.assertEqual(Episode.objects.count(), 3)
+        self.assertEqual(LogEntry.objects.filter(object_id="10").count(), 1)
+        self.assertEqual(LogEntry.objects.filter(object_id="11").count(), 0)
+        self.assertEqual(LogEntry.objects.filter(object_id="12").count(), 1)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        rows = {pk: self._defaults(f"Ep {pk}", pk) for pk in range(100, 150)}
+        ContentType.objects.get_for_model(Episode)
+        # in_bulk select, then episodes and log entries inserted inside a savepoint
+        # (50 rows stay under the SQLite parameter limit of a single INSERT)
+        with self.assertNumQueries(5):
+            bulk_create_or_update_with_log(Episode, rows)
+        self.assertEqual(Episode.objects.count(), 52)
+
+
 class GetShowsTest(TestCase):
     def setUp(self):
         get_user_model().objects.get_or_create(pk=1, defaults={"username": "testuser"})
 
-    @patch("backoffice.utils.requests.get")
+    @patch("backoffice.utils.http_client.get")
     def test_get_shows_creates_shows(self, mock_get):
-        mock_get.return_value.json.return_value = {
+        mock_get.return_value.iter_content.return_value = [json.dumps({
             "shows": [
                 {"id": 100, "name": "Show A (2020)"},
                 {"id": 101, "name": "Show B & Co"},
             ]
-        }
+        }).encode()]
         get_shows()
         self.assertEqual(Show.objects.count(), 2)
         self.assertEqual(Show.objects.get(tst_id=100).name, "Show A")
         self.assertEqual(Show.objects.get(tst_id=101).name, "Show B and Co")
+        self.assertTrue(mock_get.call_args[1]["stream"])
+        mock_get.return_value.close.assert_called_once()
+
+    @patch("backoffice.utils.bulk_create_or_update_with_log")
+    @patch("backoffice.utils.http_client.get")
+    def test_get_shows_upserts_in_batches(self, mock_get, mock_bulk):
+        raw = json.dumps({"shows": [{"id": i, "name": f"Show {i}"} for i in range(7)]}).encode()
+        mock_get.return_value.iter_content.return_value = [raw[i:i + 10] for i in range(0, len(raw), 10)]
+        get_shows(batch_size=3)
+        self.assertEqual([len(c[0][1]) for c in mock_bulk.call_args_list], [3, 3, 1])
+        self.assertEqual(mock_bulk.call_args_list[0][0][1][0], {"name": "Show 0"})
+
+    @patch("backoffice.utils.http_client.get")
+    def test_get_shows_updates_existing(self, mock_get):
+        Show.objects.create(tst_id=100, name="Old", enabled=True)
+        mock_get.return_value.iter_content.return_value = [b'{"shows": [{"id": 100, "name": "New"}]}']
+        get_shows()
+        show = Show.objects.get(tst_id=100)
+        self.assertEqual(show.name, "New")
+        self.assertTrue(show.enabled)
 
 
 class FetchShowTest(TestCase):
@@ -102,8 +182,10 @@ class FetchShowTest(TestCase):
         get_user_model().objects.get_or_create(pk=1, defaults={"username": "testuser"})
         self.show = Show.objects.create(tst_id=50, name="Test Show")
 
-    @patch("backoffice.utils.requests.get")
+    @patch("backoffice.utils.http_client.get")
     def test_fetch_show_creates_episodes(self, mock_get):
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.headers = {}
         mock_get.return_value.json.return_value = {
             "episodes": [
                 {
@@ -126,6 +208,7 @@ class FetchShowTest(TestCase):
         }
         fetch_show(self.show)
         self.assertEqual(Episode.objects.filter(show=self.show).count(), 2)
+        self.assertEqual(ShowStats.objects.get(show=self.show).total, 2)
         ep1 = Episode.objects.get(tst_id=501)
         self.assertEqual(ep1.name, "Pilot")
         self.assertEqual(ep1.season, 1)
@@ -135,8 +218,31 @@ class FetchShowTest(TestCase):
         ep2 = Episode.objects.get(tst_id=502)
         self.assertTrue(ep2.watched)
 
-    @patch("backoffice.utils.requests.get")
+    @patch("backoffice.utils.http_client.get")
+    def test_fetch_show_row_by_row_fallback(self, mock_get):
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.headers = {}
+        mock_get.return_value.json.return_value = {
+            "episodes": [
+                {
+                    "id": 504,
+                    "name": "Fallback",
+                    "season_number": 2,
+                    "number": 1,
+                    "air_date": "2024-02-01",
+                    "seen": False,
+                },
+            ]
+        }
+        fetch_show(self.show, bulk=False)
+        ep = Episode.objects.get(tst_id=504)
+        self.assertEqual(ep.name, "Fallback")
+        self.assertEqual(LogEntry.objects.filter(object_id="504").count(), 1)
+
+    @patch("backoffice.utils.http_client.get")
     def test_fetch_show_invalid_air_date(self, mock_get):
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.headers = {}
         mock_get.return_value.json.return_value = {
             "episodes": [
                 {
@@ -155,29 +261,240 @@ class FetchShowTest(TestCase):
         self.assertIsNone(ep.date)
 
 
-class SendMailTest(TestCase):
-    @patch("backoffice.utils.Client")
-    def test_send_mail_payload(self, mock_client_class):
-        mock_send = MagicMock()
-        mock_client_class.return_value.send.create = mock_send
-        send_mail("Subject", "Body", "from@test.com", ["to@test.com", "to2@test.com"])
-        mock_send.assert_called_once()
-        call_args = mock_send.call_args
-        data = call_args[1]["data"]
-        self.assertEqual(data["Messages"][0]["Subject"], "Subject")
-        self.assertEqual(data["Messages"][0]["TextPart"], "Body")
-        self.assertEqual(data["Messages"][0]["From"]["Email"], "from@test.com")
-        self.assertEqual(len(data["Messages"][0]["To"]), 2)
+class ShowSyncStateTest(TestCase):
+    def setUp(self):
+        get_user_model().objects.get_or_create(pk=1, defaults={"username": "testuser"})
+        self.show = Show.objects.create(tst_id=70, name="Synced Show")
+        self.payload = {
+            "episodes": [
+                {
+                    "id": 701,
+                    "name": "Pilot",
+                    "season_number": 1,
+                    "number": 1,
+                    "air_date": "2024-01-01",
+                    "seen": False,
+                },
+            ]
+        }
+
+    def _response(self, status_code=200, headers=None):
+        response = MagicMock(status_code=status_code, headers=headers or {})
+        response.json.return_value = self.payload
+        return response
+
+    @patch("backoffice.utils.http_client.get")
+    def test_first_sync_stores_validators_and_digest(self, mock_get):
+        mock_get.return_value = self._response(headers={"ETag": '"abc"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"})
+        fetch_show(self.show)
+        state = ShowSyncState.objects.get(show=self.show)
+        self.assertEqual(state.etag, '"abc"')
+        self.assertEqual(state.last_modified, "Mon, 01 Jan 2024 00:00:00 GMT")
+        self.assertEqual(state.digest, payload_digest(self.payload["episodes"]))
+        self.assertIsNotNone(state.synced_at)
+        self.assertGreater(state.next_check_at, state.synced_at)
+        self.assertNotIn("If-None-Match", mock_get.call_args[1]["headers"])
+
+    @patch("backoffice.utils.bulk_create_or_update_with_log")
+    @patch("backoffice.utils.http_client.get")
+    def test_not_modified_skips_diff(self, mock_get, mock_bulk):
+        ShowSyncState.objects.create(show=self.show, etag='"abc"', last_modified="yesterday", digest="x")
+        mock_get.return_value = self._response(status_code=304)
+        fetch_show(self.show)
+        headers = mock_get.call_args[1]["headers"]
+        self.assertEqual(headers["If-None-Match"], '"abc"')
+        self.assertEqual(headers["If-Modified-Since"], "yesterday")
+        mock_bulk.assert_not_called()
+        self.assertIsNotNone(ShowSyncState.objects.get(show=self.show).synced_at)
+
+    @patch("backoffice.utils.bulk_create_or_update_with_log")
+    @patch("backoffice.utils.http_client.get")
+    def test_unchanged_digest_skips_diff_but_marks_aired(self, mock_get, mock_bulk):
+        ShowSyncState.objects.create(show=self.show, digest=payload_digest(self.payload["episodes"]))
+        Episode.objects.create(
+            tst_id=701, show=self.show, name="Pilot", season=1, number=1,
+            date=datetime.date(2024, 1, 1), aired=False, watched=False)
+        mock_get.return_value = self._response()
+        fetch_show(self.show)
+        mock_bulk.assert_not_called()
+        self.assertTrue(Episode.objects.get(pk=701).aired)
+
+    @patch("backoffice.utils.bulk_create_or_update_with_log")
+    @patch("backoffice.utils.http_client.get")
+    def test_force_resyncs_unchanged_payload(self, mock_get, mock_bulk):
+        ShowSyncState.objects.create(show=self.show, etag='"abc"', digest=payload_digest(self.payload["episodes"]))
+        mock_get.return_value = self._response()
+        fetch_show(self.show, force=True)
+        self.assertNotIn("If-None-Match", mock_get.call_args[1]["headers"])
+        mock_bulk.assert_called_once()
+
+    @patch("backoffice.utils.http_client.get")
+    def test_error_response_is_not_a_sync(self, mock_get):
+        Show.objects.filter(pk=self.show.pk).update(enabled=True)
+        due = timezone.now() - datetime.timedelta(hours=1)
+        ShowSyncState.objects.create(show=self.show, etag='"abc"', next_check_at=due)
+        response = self._response(status_code=502)
+        response.json.return_value = {"error": "Bad gateway"}
+        response.raise_for_status.side_effect = requests.HTTPError("502 Server Error")
+        mock_get.return_value = response
+        with self.assertRaises(requests.HTTPError):
+            fetch_show(self.show)
+        state = ShowSyncState.objects.get(show=self.show)
+        self.assertEqual((state.etag, state.next_check_at, state.synced_at), ('"abc"', due, None))
+        self.assertIn(self.show, Show.objects.due())
+
+    def test_digest_ignores_order_and_unused_fields(self):
+        a = [{"id": 1, "name": "A", "followers": 3}, {"id": 2, "name": "B"}]
+        b = [{"id": 2, "name": "B"}, {"id": 1, "name": "A", "followers": 9}]
+        self.assertEqual(payload_digest(a), payload_digest(b))
+        self.assertNotEqual(payload_digest(a), payload_digest([{"id": 1, "name": "C"}]))
+
+
+@override_settings(SYNC_WINDOW_DAYS=2, SYNC_ACTIVE_HOURS=6, SYNC_UPCOMING_HOURS=168, SYNC_IDLE_HOURS=720)
+class ComputeNextCheckTest(TestCase):
+    def setUp(self):
+        self.show = Show.objects.create(tst_id=80, name="Scheduled")
+        self.now = timezone.now()
+        self.today = timezone.localdate(self.now)
+
+    def _episode(self, pk, days):
+        Episode.objects.create(
+            tst_id=pk, show=self.show, name="", season=1, number=pk,
+            date=self.today + datetime.timedelta(days=days), aired=days <= 0, watched=False)
+
+    def test_no_episodes_is_idle(self):
+        self.assertEqual(compute_next_check(self.show, self.now), self.now + datetime.timedelta(hours=720))
+
+    def test_ended_show_is_idle(self):
+        self._episode(1, -400)
+        self.assertEqual(compute_next_check(self.show, self.now), self.now + datetime.timedelta(hours=720))
+
+    def test_imminent_episode_is_active(self):
+        self._episode(1, 1)
+        self.assertEqual(compute_next_check(self.show, self.now), self.now + datetime.timedelta(hours=6))
 
+    def test_just_aired_episode_is_active(self):
+        self._episode(1, -1)
+        self.assertEqual(compute_next_check(self.show, self.now), self.now + datetime.timedelta(hours=6))
 
-class PrintMessagesTest(TestCase):
-    def test_print_messages_info_and_error(self):
-        request = MagicMock()
-        resp = {"Item A": "success", "Item B": False}
-        print_messages(request, resp)
-        request._messages.add.assert_called()
-        calls = [c for c in request._messages.add.call_args_list]
-        self.assertEqual(len(calls), 2)
+    def test_far_upcoming_episode_is_capped(self):
+        self._episode(1, 60)
+        self.assertEqual(compute_next_check(self.show, self.now), self.now + datetime.timedelta(hours=168))
+
+    def test_upcoming_episode_checked_before_it_airs(self):
+        self._episode(1, 5)
+        self.assertEqual(compute_next_check(self.show, self.now), self.now + datetime.timedelta(days=3))
+
+
+class ShowDueTest(TestCase):
+    def test_due_selects_enabled_shows_past_their_next_check(self):
+        now = timezone.now()
+        never = Show.objects.create(tst_id=1, name="Never synced", enabled=True)
+        past = Show.objects.create(tst_id=2, name="Past", enabled=True)
+        future = Show.objects.create(tst_id=3, name="Future", enabled=True)
+        disabled = Show.objects.create(tst_id=4, name="Disabled")
+        ShowSyncState.objects.create(show=past, next_check_at=now - datetime.timedelta(hours=1))
+        ShowSyncState.objects.create(show=future, next_check_at=now + datetime.timedelta(hours=1))
+        ShowSyncState.objects.create(show=disabled, next_check_at=now - datetime.timedelta(hours=1))
+        self.assertEqual(set(Show.objects.due(now)), {never, past})
+
+
+class RefreshShowStatsTest(TestCase):
+    def setUp(self):
+        self.show = Show.objects.create(tst_id=90, name="Counted")
+        self.empty = Show.objects.create(tst_id=91, name="Empty")
+        today = datetime.date.today()
+        for pk, aired, watched, downloaded, days in (
+            (901, True, True, True, -30),
+            (902, True, False, True, -20),
+            (903, True, False, False, -10),
+            (904, False, False, False, 5),
+            (905, False, False, False, 12),
+        ):
+            Episode.objects.create(
+                tst_id=pk, show=self.show, name="", season=1, number=pk, aired=aired, watched=watched,
+                downloaded=downloaded, date=today + datetime.timedelta(days=days))
+
+    def test_counts_and_next_air_date(self):
+        with self.assertNumQueries(2):
+            refresh_show_stats([self.show.pk, self.empty.pk])
+        stats = ShowStats.objects.get(show=self.show)
+        self.assertEqual((stats.total, stats.to_watch, stats.to_download), (5, 2, 1))
+        self.assertEqual(stats.next_air_date, datetime.date.today() + datetime.timedelta(days=5))
+        empty = ShowStats.objects.get(show=self.empty)
+        self.assertEqual((empty.total, empty.to_watch, empty.to_download, empty.next_air_date), (0, 0, 0, None))
+
+    def test_refresh_updates_existing_row(self):
+        refresh_show_stats([self.show.pk])
+        Episode.objects.filter(pk=903).update(downloaded=True)
+        refresh_show_stats([self.show.pk])
+        self.assertEqual(ShowStats.objects.get(show=self.show).to_download, 0)
+        self.assertEqual(ShowStats.objects.count(), 1)
+
+    def test_upsert_without_conflict_target(self):
+        # MySQL does not support naming the conflicting fields
+        with patch.object(connection.features, "supports_update_conflicts_with_target", False):
+            refresh_show_stats([self.show.pk])
+        self.assertEqual(ShowStats.objects.get(show=self.show).total, 5)
+
+
+class FetchShowsTest(TestCase):
+    def setUp(self):
+        get_user_model().objects.get_or_create(pk=1, defaults={"username": "testuser"})
+        self.shows = [Show.objects.create(tst_id=pk, name=f"Show {pk}") for pk in (60, 61, 62)]
+
+    @staticmethod
+    def _payload(url, **kwargs):
+        show_id = int(url.split("/")[-3])
+        response = MagicMock(status_code=200, headers={})
+        response.json.return_value = {
+            "episodes": [
+                {
+                    "id": show_id * 10,
+                    "name": "Pilot",
+                    "season_number": 1,
+                    "number": 1,
+                    "air_date": "2024-01-01",
+                    "seen": False,
+                },
+            ]
+        }
+        return response
+
+    @patch("backoffice.utils.http_client.get")
+    def test_fetch_shows_concurrently(self, mock_get):
+        mock_get.side_effect = self._payload
+        results = list(fetch_shows(self.shows, workers=3))
+        self.assertEqual(sorted(show.pk for show, _ in results), [60, 61, 62])
+        self.assertTrue(all(exc is None for _, exc in results))
+        self.assertEqual(sorted(Episode.objects.values_list("pk", flat=True)), [600, 610, 620])
+
+    @patch("backoffice.utils.http_client.get")
+    def test_fetch_shows_reports_failures_per_show(self, mock_get):
+        def side_effect(url, **kwargs):
+            if "/61/" in url:
+                raise ConnectionError("boom")
+            return self._payload(url, **kwargs)
+        mock_get.side_effect = side_effect
+        results = dict(fetch_shows(self.shows, workers=2))
+        self.assertIsInstance(results[self.shows[1]], ConnectionError)
+        self.assertIsNone(results[self.shows[0]])
+        self.assertEqual(Episode.objects.count(), 2)
+
+    @patch("backoffice.utils.http_client.get")
+    def test_fetch_shows_sequential(self, mock_get):
+        mock_get.side_effect = self._payload
+        results = list(fetch_shows(self.shows))
+        self.assertEqual([show for show, _ in results], self.shows)
+
+    @patch("backoffice.utils.http_client.get")
+    def test_fetch_shows_logs_once_per_run_for_user(self, mock_get):
+        mock_get.side_effect = self._payload
+        user = get_user_model().objects.create_user("acting")
+        with patch("backoffice.audit.LogEntry.objects.bulk_create", wraps=LogEntry.objects.bulk_create) as mock_bulk:
+            list(fetch_shows(self.shows, user=user))
+        mock_bulk.assert_called_once()
+        self.assertEqual(LogEntry.objects.filter(user=user).count(), 3)
 
 
 class DownloadEpisodeTest(TestCase):
@@ -195,69 +512,269 @@ class DownloadEpisodeTest(TestCase):
             downloaded=False,
         )
 
-    @patch("backoffice.utils.send_mail")
+    @patch("backoffice.utils.notify")
     @patch("backoffice.utils.lookup")
-    def test_download_episode_success_updates_downloaded(self, mock_lookup, mock_send_mail):
+    def test_download_episode_success_updates_downloaded(self, mock_lookup, mock_notify):
         mock_lookup.return_value = "Some.Title"
         qs = Episode.objects.filter(pk=self.episode.pk)
         resp = download_episode(qs)
         self.assertTrue(resp[self.episode])
         self.episode.refresh_from_db()
         self.assertTrue(self.episode.downloaded)
-        mock_send_mail.assert_called_once()
+        self.assertEqual(ShowStats.objects.get(show=self.show).to_download, 0)
+        mock_notify.assert_called_once()
+
+    @override_settings(SEASON_PACK_THRESHOLD=0)
+    @patch("backoffice.utils.notify")
+    @patch("backoffice.utils.lookup")
+    def test_download_episode_runs_lookups_in_parallel(self, mock_lookup, mock_notify):
+        for number in range(2, 5):
+            Episode.objects.create(
+                tst_id=10 + number, show=self.show, name="", season=1, number=number,
+                aired=True, watched=False, downloaded=False)
+        barrier = threading.Barrier(4, timeout=5)
+
+        def side_effect(path, name, *args):
+            # Only returns if the 4 lookups are in flight at the same time
+            barrier.wait()
+            return name
+
+        mock_lookup.side_effect = side_effect
+        resp = download_episode(Episode.objects.all(), workers=4)
+        self.assertEqual(len(resp), 4)
+        self.assertTrue(all(resp.values()))
+        self.assertEqual(Episode.objects.filter(downloaded=True).count(), 4)
+        self.assertEqual(LogEntry.objects.filter(change_message="The episode has been download").count(), 4)
+        mock_notify.assert_called_once()
+
+    @patch("backoffice.utils.notify")
+    @patch("backoffice.utils.lookup")
+    def test_download_episode_lookup_error_only_fails_that_episode(self, mock_lookup, mock_notify):
+        other = Episode.objects.create(
+            tst_id=11, show=self.show, name="", season=1, number=2, aired=True, watched=False, downloaded=False)
+
+        def side_effect(path, name, *args):
+            if name.endswith("E01"):
+                raise ConnectionError("tracker down")
+            return "Title"
+
+        mock_lookup.side_effect = side_effect
+        resp = download_episode(Episode.objects.all())
+        self.assertFalse(resp[self.episode])
+        self.assertTrue(resp[other])
+        self.assertIn("Show S01E01: False", mock_notify.call_args[0][1])
+        self.assertIn("Show S01E02: True", mock_notify.call_args[0][1])
+
+    @patch("backoffice.utils.notify")
+    @patch("backoffice.utils.lookup")
+    def test_download_episode_nothing_found_sends_nothing(self, mock_lookup, mock_notify):
+        mock_lookup.return_value = False
+        download_episode(Episode.objects.all())
+        mock_notify.assert_not_called()
 
-    @patch("backoffice.utils.send_mail")
+    @patch("backoffice.utils.notify")
     @patch("backoffice.utils.lookup")
-    def test_download_episode_empty_list(self, mock_lookup, mock_send_mail):
+    def test_download_episode_empty_list(self, mock_lookup, mock_notify):
         resp = download_episode(Episode.objects.none())
         self.assertEqual(resp, {})
         mock_lookup.assert_not_called()
-        mock_send_mail.assert_not_called()
+        mock_notify.assert_not_called()
+
+
+@override_settings(SEASON_PACK_THRESHOLD=3)
+class SeasonPackTest(TestCase):
+    def setUp(self):
+        get_user_model().objects.get_or_create(pk=1, defaults={"username": "testuser"})
+        self.show = Show.objects.create(tst_id=1, name="Show", enabled=True)
+        for number in range(1, 6):
+            Episode.objects.create(
+                tst_id=number, show=self.show, name="", season=1, number=number, aired=True, watched=False)
+        Episode.objects.create(tst_id=21, show=self.show, name="", season=2, number=1, aired=True, watched=False)
+
+    @patch("backoffice.utils.notify")
+    @patch("backoffice.utils.lookup")
+    def test_pack_covers_season_and_gaps_are_looked_up(self, mock_lookup, mock_notify):
+        mock_lookup.side_effect = lambda path, name, *args: {
+            "Show S01": "Show.S01E01-E04.MULTi.1080p",
+            "Show S01E05": "Show.S01E05",
+            "Show S02E01": False,
+        }[name]
+        resp = download_episode(Episode.objects.all())
+        self.assertEqual(sorted(c[0][1] for c in mock_lookup.call_args_list), ["Show S01", "Show S01E05", "Show S02E01"])
+        self.assertEqual(sum(resp.values()), 5)
+        self.assertEqual(list(Episode.objects.filter(downloaded=False).values_list("pk", flat=True)), [21])
+
+    @patch("backoffice.utils.notify")
+    @patch("backoffice.utils.lookup")
+    def test_no_pack_falls_back_to_episodes(self, mock_lookup, mock_notify):
+        mock_lookup.side_effect = lambda path, name, *args: False if name == "Show S01" else name
+        resp = download_episode(Episode.objects.all())
+        self.assertEqual(mock_lookup.call_count, 7)
+        self.assertTrue(all(resp.values()))
+
+
+class DownloadQueueTest(TestCase):
+    def setUp(self):
+        get_user_model().objects.get_or_create(pk=1, defaults={"username": "testuser"})
+        show = Show.objects.create(tst_id=1, name="Show", enabled=True)
+        for number in range(1, 6):
+            Episode.objects.create(
+                tst_id=number, show=show, name="", season=1, number=number, aired=True, watched=False,
+                date=datetime.date(2024, 1, number))
+
+    @override_settings(SEASON_PACK_THRESHOLD=2)
+    @patch("backoffice.utils.notify")
+    @patch("backoffice.utils.lookup")
+    def test_pack_marks_episodes_of_later_batches(self, mock_lookup, mock_notify):
+        Episode.objects.filter(pk=4).claim("other-host")
+        mock_lookup.side_effect = lambda path, name, *args: "Show.S01.MULTi.1080p" if name == "Show S01" else name
+        resp = download_queue(batch_size=2)
+        self.assertEqual([c[0][1] for c in mock_lookup.call_args_list], ["Show S01"])
+        self.assertEqual(sorted(episode.pk for episode in resp), [1, 2, 3, 5])
+        # An episode leased by another host is left to it
+        self.assertEqual(list(Episode.objects.to_download()), [Episode.objects.get(pk=4)])
+
+    @patch("backoffice.utils.notify")
+    @patch("backoffice.utils.lookup")
+    def test_downloads_in_batches_and_releases_misses(self, mock_lookup, mock_notify):
+        mock_lookup.side_effect = lambda path, name, *args: None if name.endswith("E02") else name
+        resp = download_queue(batch_size=2)
+        self.assertEqual(len(resp), 5)
+        self.assertEqual(mock_lookup.call_count, 5)
+        self.assertEqual(mock_notify.call_count, 3)
+        self.assertEqual(list(Episode.objects.to_download()), [Episode.objects.get(pk=2)])
+        self.assertFalse(Episode.objects.exclude(claimed_by="").exists())
+
+    @patch("backoffice.utils.notify")
+    @patch("backoffice.utils.lookup")
+    def test_skips_episodes_leased_elsewhere(self, mock_lookup, mock_notify):
+        Episode.objects.filter(pk__in=[1, 2]).claim("other-host")
+        mock_lookup.side_effect = lambda path, name, *args: name
+        resp = download_queue()
+        self.assertEqual(sorted(episode.pk for episode in resp), [3, 4, 5])
+        self.assertFalse(Episode.objects.get(pk=1).downloaded)
+
+
+@override_settings(LOOKUP_BACKOFF_BASE=3600, LOOKUP_BACKOFF_MAX=4 * 3600)
+class LookupBackoffTest(TestCase):
+    def setUp(self):
+        get_user_model().objects.get_or_create(pk=1, defaults={"username": "testuser"})
+        show = Show.objects.create(tst_id=1, name="Show", enabled=True)
+        self.episode = Episode.objects.create(
+            tst_id=1, show=show, name="", season=1, number=1, aired=True, watched=False,
+            date=datetime.date(2024, 1, 1))
+
+    def test_backoff_doubles_up_to_cap(self):
+        self.assertEqual([lookup_backoff(n) for n in range(1, 6)], [3600, 7200, 14400, 14400, 14400])
+
+    def test_misses_grow_and_reset_on_new_air_date(self):
+        now = timezone.now()
+        for _ in range(3):
+            self.episode.refresh_from_db()
+            record_lookup_misses([self.episode], now=now)
+        self.episode.refresh_from_db()
+        self.assertEqual(self.episode.lookup_attempts, 3)
+        self.assertEqual(self.episode.next_lookup_at, now + datetime.timedelta(hours=4))
+        self.assertEqual(self.episode.lookup_date, self.episode.date)
+
+        Episode.objects.filter(pk=1).update(date=datetime.date(2024, 2, 1))
+        self.episode.refresh_from_db()
+        record_lookup_misses([self.episode], now=now)
+        self.episode.refresh_from_db()
+        self.assertEqual(self.episode.lookup_attempts, 1)
+
+    @patch("backoffice.utils.notify")
+    @patch("backoffice.utils.lookup")
+    def test_queue_skips_episodes_in_backoff(self, mock_lookup, mock_notify):
+        mock_lookup.return_value = False
+        download_queue()
+        download_queue()
+        self.assertEqual(mock_lookup.call_count, 1)
+        self.assertEqual(Episode.objects.get(pk=1).lookup_attempts, 1)
+
+    @patch("backoffice.utils.notify")
+    @patch("backoffice.utils.lookup", side_effect=ConnectionError("tracker down"))
+    def test_lookup_error_does_not_back_off(self, mock_lookup, mock_notify):
+        download_queue()
+        self.assertEqual(Episode.objects.get(pk=1).lookup_attempts, 0)
 
 
 class DownloadByUrlsTest(TestCase):
-    @patch("backoffice.utils.send_mail")
+    @patch("backoffice.utils.notify")
     @patch("backoffice.utils.lookup")
-    def test_download_by_urls_with_torrent_id(self, mock_lookup, mock_send_mail):
+    def test_download_by_urls_with_torrent_id(self, mock_lookup, mock_notify):
         mock_lookup.return_value = "Title"
         resp = download_by_urls(["https://example.com/torrent/12345"])
-        self.assertEqual(resp["Title"], True)
+        self.assertEqual(resp, {"https://example.com/torrent/12345": "Title"})
         mock_lookup.assert_called_once()
         self.assertEqual(mock_lookup.call_args[0][6], "12345")
 
+    @patch("backoffice.utils.notify")
     @patch("backoffice.utils.lookup")
-    def test_download_by_urls_no_match_returns_early(self, mock_lookup):
-        resp = download_by_urls(["https://example.com/no-digits"])
-        self.assertEqual(resp, {})
-        mock_lookup.assert_not_called()
+    def test_download_by_urls_reports_every_url(self, mock_lookup, mock_notify):
+        def side_effect(path, name, *args):
+            if args[-1] == "2":
+                raise ConnectionError("tracker down")
+            return False if args[-1] == "3" else f"Title {args[-1]}"
+
+        mock_lookup.side_effect = side_effect
+        urls = [
+            "https://example.com/no-digits",
+            "https://example.com/torrent/1",
+            "https://example.com/torrent/2",
+            "https://example.com/torrent/3",
+        ]
+        resp = download_by_urls(urls)
+        self.assertEqual(list(resp), urls)
+        self.assertEqual(list(resp.values()), [False, "Title 1", False, False])
+        self.assertEqual(mock_lookup.call_count, 3)
+        mock_notify.assert_called_once()
+
+    @patch("backoffice.utils.notify")
+    @patch("backoffice.utils.lookup")
+    def test_download_by_urls_runs_lookups_in_parallel(self, mock_lookup, mock_notify):
+        barrier = threading.Barrier(3, timeout=5)
+
+        def side_effect(path, name, *args):
+            # Only returns if the 3 lookups are in flight at the same time
+            barrier.wait()
+            return name
+
+        mock_lookup.side_effect = side_effect
+        urls = [f"https://example.com/torrent/{i}" for i in range(3)]
+        self.assertEqual(download_by_urls(urls, workers=3), {url: url for url in urls})
 
 
 class LookupTest(TestCase):
-    @patch("backoffice.utils.torrent_parser.create_torrent_file")
-    @patch("backoffice.utils.torrent_parser.parse_torrent_file")
-    @patch("backoffice.utils.requests.get")
+    def setUp(self):
+        caches[settings.SEARCH_CACHE_ALIAS].clear()
+
+    @patch("backoffice.utils.http_client.get")
     @patch("backoffice.utils.secrets.choice")
-    def test_lookup_with_torrent_id_success(self, mock_secrets, mock_get, mock_parse, mock_create):
+    def test_lookup_with_torrent_id_success(self, mock_secrets, mock_get):
         mock_secrets.return_value = "a"
         fake_pass = "a" * 32
+        announce = f"http://tracker/{fake_pass}/announce".encode()
+        content = b"d8:announce%d:%s4:infod4:name4:fileee" % (len(announce), announce)
         mock_get.side_effect = [
             MagicMock(json=MagicMock(return_value={"title": "My Show S01E01", "announce": f"http://tracker/{fake_pass}"})),
-            MagicMock(iter_content=MagicMock(return_value=[b"x"])),
+            MagicMock(iter_content=MagicMock(return_value=[content[:10], content[10:]])),
         ]
-        mock_parse.return_value = {"announce": f"http://tracker/{fake_pass}"}
         result = lookup(
             "https://ygg.test",
             "name",
             "real_pass",
-            "/tmp/to_add",
+            settings.TO_ADD,
             "MULTi",
             "1080p",
             torrent_id="999",
         )
         self.assertEqual(result, "My_Show_S01E01")
-        mock_create.assert_called_once()
+        self.assertEqual(mock_get.call_args_list[1][1]["params"], {"passkey": fake_pass})
+        with open(os.path.join(settings.TO_ADD, "My_Show_S01E01.torrent"), "rb") as file:
+            self.assertEqual(file.read(), b"d8:announce33:http://tracker/real_pass/announce4:infod4:name4:fileee")
 
-    @patch("backoffice.utils.requests.get")
+    @patch("backoffice.utils.http_client.get")
     def test_lookup_with_torrent_id_no_torrent_returns_false(self, mock_get):
         mock_get.return_value.json.return_value = None
         result = lookup(
@@ -270,3 +787,67 @@ class LookupTest(TestCase):
             torrent_id="999",
         )
         self.assertFalse(result)
+
+    @patch("backoffice.utils.http_client.get")
+    def test_lookup_search_results_are_cached(self, mock_get):
+        mock_get.return_value.json.return_value = []
+        args = ("https://ygg.test", "My Show S01E01", "pass", "/tmp", "MULTi", "1080p")
+        self.assertFalse(lookup(*args))
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertFalse(lookup(*args))
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch("backoffice.utils.write_atomic")
+    @patch("backoffice.utils.http_client.get")
+    def test_lookup_search_makes_one_query_and_ranks_locally(self, mock_get, mock_write):
+        mock_get.side_effect = [
+            MagicMock(json=MagicMock(return_value=[
+                {"id": 1, "title": "My.Show.S01E01.VOSTFR.720p", "seeders": 900},
+                {"id": 2, "title": "My.Show.S01E01.MULTi.1080p", "seeders": 4},
+                {"id": 3, "title": "My.Show.S01E03.MULTi.1080p", "seeders": 50},
+            ])),
+            MagicMock(iter_content=MagicMock(return_value=[b"d8:announce3:urle"])),
+        ]
+        result = lookup("https://ygg.test", "My Show S01E01", "pass", "/tmp/to_add", "MULTi", "1080p")
+        self.assertEqual(result, "My.Show.S01E01.MULTi.1080p")
+        self.assertEqual(mock_get.call_args_list[0][1]["params"]["q"], "My Show S01E01")
+        self.assertEqual(mock_get.call_args_list[1][0][0], "https://ygg.test/torrent/2/download")
+        mock_write.assert_called_once_with("/tmp/to_add", "My.Show.S01E01.MULTi.1080p.torrent", b"d8:announce3:urle")
+
+
+class SearchTorrentsTest(TestCase):
+    def setUp(self):
+        caches[settings.SEARCH_CACHE_ALIAS].clear()
+
+    @patch("backoffice.utils.http_client.get")
+    def test_key_is_normalized_query_and_ordering(self, mock_get):
+        mock_get.return_value.json.return_value = [{"id": 1}]
+        self.assertEqual(search_torrents("https://ygg.test", "My Show  S01E01"), [{"id": 1}])
+        self.assertEqual(search_torrents("https://ygg.test", "my show s01e01"), [{"id": 1}])
+        self.assertEqual(mock_get.call_count, 1)
+        search_torrents("https://ygg.test", "my show s01e01", order_by="seeders")
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(mock_get.call_args[1]["params"], {"q": "my show s01e01", "order_by": "seeders"})
+
+    @patch("backoffice.utils.http_client.get")
+    def test_errors_are_not_cached(self, mock_get):
+        response = mock_get.return_value
+        response.json.return_value = {"detail": "Service Unavailable"}
+        response.raise_for_status.side_effect = requests.HTTPError("503 Server Error")
+        with self.assertRaises(requests.HTTPError):
+            search_torrents("https://ygg.test", "q")
+        # A 200 that is not a list of torrents is an error as well
+        response.raise_for_status.side_effect = None
+        with self.assertRaises(ValueError):
+            search_torrents("https://ygg.test", "q")
+        response.json.return_value = [{"id": 1}]
+        self.assertEqual(search_torrents("https://ygg.test", "q"), [{"id": 1}])
+        self.assertEqual(mock_get.call_count, 3)
+
+    @override_settings(SEARCH_CACHE_TTL=0)
+    @patch("backoffice.utils.http_client.get")
+    def test_expired_entries_are_refetched(self, mock_get):
+        mock_get.return_value.json.return_value = None
+        self.assertEqual(search_torrents("https://ygg.test", "q"), [])
+        search_torrents("https://ygg.test", "q")
+        self.assertEqual(mock_get.call_count, 2)
@@ -0,0 +1,124 @@
+"""
+In-memory handling of downloaded .torrent files.
+
+Torrents are fetched into a size-capped buffer, their tracker passkey is
+rewritten directly on the bencoded bytes (the `info` dictionary, and so the
+info-hash, is copied untouched), and the result is written to the watch folder
+with write-then-rename so it never sees a partial file.
+"""
+import os
+import tempfile
+
+from django.conf import settings
+
+from backoffice import http_client
+
+ANNOUNCE_KEYS = (b"announce", b"announce-list")
+
+# os.umask can only be read by setting it, which would race with threads
+# creating files, so it is read once at import
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def download_torrent(url, params=None):
+    """Download a .torrent into memory, refusing files above settings.TORRENT_MAX_SIZE bytes."""
+    max_size = getattr(settings, "TORRENT_MAX_SIZE", 10 * 1024 * 1024)
+    response = http_client.get(url, params=params, stream=True)
+    try:
+        response.raise_for_status()
+        content = bytearray()
+        for chunk in response.iter_content(64 * 1024):
+            content += chunk
+            if len(content) > max_size:
+                raise ValueError(f"Torrent larger than {max_size} bytes: {url}")
+        return bytes(content)
+    finally:
+        response.close()
+
+
+def rewrite_announce(data, old, new):
+    """
+    Replace `old` by `new` in the `announce` and `announce-list` values of the
+    bencoded torrent `data`, fixing the string length prefixes.
+    """
+    old, new = old.encode(), new.encode()
+    if data[:1] != b"d":
+        raise ValueError("Torrent is not a bencoded dictionary")
+    out = [b"d"]
+    i = 1
+    while data[i:i + 1] != b"e":
+        key, value_start = _read_string(data, i)
+        value_end = _skip(data, value_start)
+        out.append(data[i:value_start])
+        if key in ANNOUNCE_KEYS:
+            out.append(_replace_in_strings(data, value_start, old, new)[0])
+        else:
+            out.append(data[value_start:value_end])
+        i = value_end
+    out.append(data[i:])
+    return b"".join(out)
+
+
+def write_atomic(directory, filename, data):
+    """Write `data` to directory/filename through a hidden temporary file and a rename."""
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            # mkstemp creates the file 0600; the torrent daemon may run as another user
+            os.fchmod(file.fileno(), 0o666 & ~_UMASK)
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, os.path.join(directory, filename))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _read_string(data, i):
+    """Return the bencoded byte string starting at data[i] and the index past it."""
+    colon = data.index(b":", i)
+    end = colon + 1 + int(data[i:colon])
+    if end > len(data):
+        raise ValueError(f"Truncated bencoded string at offset {i}")
+    return data[colon + 1:end], end
+
+
+def _skip(data, i):
+    """Return the index just past the bencoded value starting at data[i]."""
+    token = data[i:i + 1]
+    if token == b"i":
+        return data.index(b"e", i) + 1
+    if token in (b"l", b"d"):
+        i += 1
+        while data[i:i + 1] != b"e":
+            if not data[i:i + 1]:
+                raise ValueError("Truncated bencoded container")
+            i = _skip(data, i)
+        return i + 1
+    if token.isdigit():
+        return _read_string(data, i)[1]
+    raise ValueError(f"Invalid bencoded data at offset {i}")
+
+
+def _replace_in_strings(data, i, old, new):
+    """Re-encode the value at data[i] with `old` replaced in every string (lists are walked)."""
+    token = data[i:i + 1]
+    if token.isdigit():
+        value, end = _read_string(data, i)
+        value = value.replace(old, new)
+        return b"%d:%s" % (len(value), value), end
+    if token == b"l":
+        out = [b"l"]
+        i += 1
+        while data[i:i + 1] != b"e":
+            if not data[i:i + 1]:
+                raise ValueError("Truncated bencoded list")
+            value, i = _replace_in_strings(data, i, old, new)
+            out.append(value)
+        out.append(b"e")
+        return b"".join(out), i + 1
+    end = _skip(data, i)
+    return data[i:end], end
@@ -1,66 +1,171 @@
 import datetime
+import hashlib
+import json
 import logging
 import os
 import re
 import secrets
+import socket
 import string
 import unicodedata
-import requests
-import torrent_parser
-
-from backoffice.models import Show, Episode
+import uuid
+
+from backoffice import http_client
+from backoffice.audit import AuditBuffer
+from backoffice.json_stream import iter_array_items
+from backoffice.models import Show, Episode, ShowStats, ShowSyncState
+from backoffice.notifications import notify
+from backoffice.ranking import pack_coverage, pick_best
+from backoffice.torrents import download_torrent, rewrite_announce, write_atomic
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from django.conf import settings
-from django.contrib import messages
-from django.contrib.admin.models import LogEntry, ADDITION, CHANGE
-from django.contrib.contenttypes.models import ContentType
+from django.contrib.admin.models import ADDITION, CHANGE
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import Count, F, Max, Min, Q
+from django.utils import timezone
 from django.utils.encoding import force_str
-from mailjet_rest import Client
 from urllib.parse import urlparse
 
 logger = logging.getLogger(__name__)
 
+PAYLOAD_DIGEST_FIELDS = ("id", "name", "season_number", "number", "air_date", "seen")
+
 
-def get_shows():
+def get_shows(batch_size=None, user=None):
     """
     Fetch the API to get the Show.
     Add or update them if already exists.
+    The profile is parsed while it streams in and shows are upserted in batches
+    of `batch_size` (settings.SHOW_BATCH_SIZE), so memory does not grow with the account.
+    Changes are logged in the admin on behalf of `user`.
     """
+    batch_size = batch_size or getattr(settings, "SHOW_BATCH_SIZE", 500)
     final_url = f"{settings.USER_URL}/{settings.USER_ID}/profile"
-    resp = requests.get(final_url, params=settings.USER_PARAMS, headers=settings.REQUESTS_HEADERS).json()
+    response = http_client.get(final_url, params=settings.USER_PARAMS, headers=settings.REQUESTS_HEADERS, stream=True)
     pattern = re.compile(r"\(\d{4}\)")
-    for show in resp["shows"]:
-        show_id = show['id']
-        name = re.sub(pattern, "", show['name'].replace("&", "and")).strip()
-        create_or_update_with_log(
-            Show,
-            tst_id=show_id,
-            defaults={
-                "name": name
+    batch = {}
+    try:
+        with AuditBuffer(user) as audit:
+            for show in iter_array_items(response.iter_content(chunk_size=64 * 1024), "shows"):
+                show_id = show['id']
+                name = re.sub(pattern, "", show['name'].replace("&", "and")).strip()
+                batch[show_id] = {"name": name}
+                if len(batch) >= batch_size:
+                    bulk_create_or_update_with_log(Show, batch, audit=audit)
+                    batch = {}
+            if batch:
+                bulk_create_or_update_with_log(Show, batch, audit=audit)
+    finally:
+        response.close()
+
+
+def fetch_show(show, bulk=True, force=False, audit=None):
+    """
+    Fetch the API to get the episodes of a Show.
+    Episodes are synced in one set-based pass unless `bulk` is False,
+    in which case each one goes through create_or_update_with_log.
+    Unchanged payloads are skipped unless `force` is True.
+    """
+    sync_state = None if force else ShowSyncState.objects.filter(show=show).first()
+    sync_show(show, fetch_show_data(show, sync_state), bulk=bulk, force=force, audit=audit)
+
+
+def fetch_shows(shows, workers=1, force=False, user=None):
+    """
+    Fetch several Shows, downloading up to `workers` payloads at once.
+    Database writes stay in the calling thread, one show at a time, and
+    their admin log entries are written in batches on behalf of `user`.
+    Yields (show, exception) as each show is done; exception is None on success.
+    """
+    shows = list(shows)
+    with AuditBuffer(user) as audit:
+        if workers <= 1:
+            for show in shows:
+                try:
+                    fetch_show(show, force=force, audit=audit)
+                except Exception as exc:
+                    logger.error(f"Failed to fetch {show}: {exc}")
+                    yield show, exc
+                else:
+                    yield show, None
+            return
+
+        sync_states = {} if force else ShowSyncState.objects.in_bulk([show.pk for show in shows])
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = {
+                executor.submit(fetch_show_data, show, sync_states.get(show.pk)): show
+                for show in shows
             }
-        )
+            for future in as_completed(futures):
+                show = futures[future]
+                try:
+                    sync_show(show, future.result(), force=force, audit=audit)
+                except Exception as exc:
+                    logger.error(f"Failed to fetch {show}: {exc}")
+                    yield show, exc
+                else:
+                    yield show, None
+        finally:
+            executor.shutdown(cancel_futures=True)
 
 
-def fetch_show(show):
+def fetch_show_data(show, sync_state=None):
+    """
+    Download the episode payload of a Show. Safe to call from worker threads.
+    With a `sync_state`, the request is made conditional on its ETag/Last-Modified.
+    """
     final_url = f"{settings.SHOW_URL}/{show.tst_id}/data/en"
-    resp = requests.get(final_url, params=settings.SHOW_PARAMS, headers=settings.REQUESTS_HEADERS).json()
+    headers = dict(settings.REQUESTS_HEADERS)
+    if sync_state and sync_state.etag:
+        headers["If-None-Match"] = sync_state.etag
+    if sync_state and sync_state.last_modified:
+        headers["If-Modified-Since"] = sync_state.last_modified
+    return http_client.get(final_url, params=settings.SHOW_PARAMS, headers=headers)
+
+
+def sync_show(show, response, bulk=True, force=False, audit=None):
+    """
+    Apply a response fetched by fetch_show_data to the database.
+    A 304 or a payload whose digest matches the last sync skips the episode diff.
+    """
+    sync_state, _ = ShowSyncState.objects.get_or_create(show=show)
+    sync_state.synced_at = timezone.now()
+    if response.status_code == 304:
+        logger.info(f"{show} not modified since last sync")
+        _mark_aired(show)
+        refresh_show_stats([show.pk])
+        sync_state.next_check_at = compute_next_check(show, sync_state.synced_at)
+        sync_state.save(update_fields=["synced_at", "next_check_at"])
+        return
+
+    # An error body must not pass for a sync, nor push the next check out
+    response.raise_for_status()
+    resp = response.json()
+    sync_state.etag = response.headers.get("ETag", "")
+    sync_state.last_modified = response.headers.get("Last-Modified", "")
     if "episodes" in resp:
-        for episode in resp.get("episodes", []):
-            episode_id = episode.get("id")
-            air_date_str = episode.get("air_date")
-            aired = False
-            air_date = None
-            if air_date_str:
-                try:
-                    air_date = datetime.datetime.strptime(air_date_str, '%Y-%m-%d').date()
-                    aired = air_date <= datetime.date.today()
-                except (ValueError, TypeError):
-                    # Invalid or malformed date string — leave aired as False
-                    pass
-
-            create_or_update_with_log(
-                Episode,
-                tst_id=episode_id,
-                defaults={
+        digest = payload_digest(resp["episodes"])
+        if digest == sync_state.digest and not force:
+            logger.info(f"{show} payload unchanged since last sync")
+            _mark_aired(show)
+        else:
+            episodes = {}
+            for episode in resp.get("episodes", []):
+                episode_id = episode.get("id")
+                air_date_str = episode.get("air_date")
+                aired = False
+                air_date = None
+                if air_date_str:
+                    try:
+                        air_date = datetime.datetime.strptime(air_date_str, '%Y-%m-%d').date()
+                        aired = air_date <= datetime.date.today()
+                    except (ValueError, TypeError):
+                        # Invalid or malformed date string — leave aired as False
+                        pass
+
+                episodes[episode_id] = {
                     "show": show,
                     "name": episode['name'],
                     "season": episode['season_number'],
@@ -69,125 +174,323 @@ def fetch_show(show):
                     "date": air_date,
                     "aired": aired
                 }
-            )
+
+            if bulk:
+                bulk_create_or_update_with_log(Episode, episodes, audit=audit)
+            else:
+                for episode_id, defaults in episodes.items():
+                    create_or_update_with_log(Episode, tst_id=episode_id, defaults=defaults, audit=audit)
+            sync_state.digest = digest
+    refresh_show_stats([show.pk])
+    sync_state.next_check_at = compute_next_check(show, sync_state.synced_at)
+    sync_state.save()
+
+
+def compute_next_check(show, now=None):
+    """
+    Return when a Show should be synced again, based on its episode air dates.
+    Shows with an episode airing or aired within SYNC_WINDOW_DAYS are checked
+    every SYNC_ACTIVE_HOURS, shows with a later episode announced at most every
+    SYNC_UPCOMING_HOURS (and again when it gets close), and shows with nothing
+    upcoming every SYNC_IDLE_HOURS.
+    """
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    window = datetime.timedelta(days=getattr(settings, "SYNC_WINDOW_DAYS", 2))
+    active = datetime.timedelta(hours=getattr(settings, "SYNC_ACTIVE_HOURS", 6))
+    upcoming = datetime.timedelta(hours=getattr(settings, "SYNC_UPCOMING_HOURS", 24 * 7))
+    idle = datetime.timedelta(hours=getattr(settings, "SYNC_IDLE_HOURS", 24 * 30))
+
+    dates = Episode.objects.filter(show=show).aggregate(
+        last_aired=Max("date", filter=Q(date__lte=today)),
+        next_air=Min("date", filter=Q(date__gt=today)),
+    )
+    last_aired, next_air = dates["last_aired"], dates["next_air"]
+    if (next_air and next_air - today <= window) or (last_aired and today - last_aired <= window):
+        return now + active
+    if next_air:
+        until_window = datetime.timedelta(days=(next_air - today).days) - window
+        return now + max(active, min(upcoming, until_window))
+    return now + idle
+
+
+def refresh_show_stats(show_ids):
+    """
+    Recompute the ShowStats rows of the given Shows with one aggregate query
+    and one upsert. Called by every path that changes their episodes.
+    """
+    show_ids = set(show_ids)
+    if not show_ids:
+        return
+    rows = Episode.objects.filter(show_id__in=show_ids).values("show_id").annotate(
+        total=Count("pk"),
+        to_watch=Count("pk", filter=Q(aired=True, watched=False)),
+        to_download=Count("pk", filter=Q(aired=True, watched=False, downloaded=False)),
+        next_air_date=Min("date", filter=Q(date__gte=datetime.date.today())),
+    )
+    stats = {row.pop("show_id"): row for row in rows}
+    # MySQL upserts on any unique key and rejects an explicit conflict target
+    unique_fields = ["show"] if connection.features.supports_update_conflicts_with_target else None
+    ShowStats.objects.bulk_create(
+        [ShowStats(show_id=show_id, **stats.get(show_id, {})) for show_id in show_ids],
+        update_conflicts=True,
+        unique_fields=unique_fields,
+        update_fields=["total", "to_watch", "to_download", "next_air_date"],
+    )
+
+
+def payload_digest(episodes):
+    """Return a stable digest of the episode fields sync_show relies on."""
+    normalized = sorted(
+        (
+            {key: episode.get(key) for key in PAYLOAD_DIGEST_FIELDS}
+            for episode in episodes
+        ),
+        key=lambda episode: str(episode["id"]),
+    )
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+
+def _mark_aired(show):
+    """Flip `aired` on episodes whose air date has passed since they were synced."""
+    count = Episode.objects.filter(show=show, aired=False, date__lte=datetime.date.today()).update(aired=True)
+    if count:
+        logger.info(f"Marked {count} episode(s) of {show} as aired")
 
 
-def download_episode(episode_list):
+def download_episode(episode_list, workers=None, user=None):
+    """
+    Look up and download the given episodes, running up to `workers`
+    (settings.DOWNLOAD_WORKERS) lookups at once. Seasons with at least
+    SEASON_PACK_THRESHOLD pending episodes are first searched as one pack,
+    which also marks the pending episodes it holds outside `episode_list`;
+    only the episodes a found pack does not hold are looked up one by one.
+    Database writes, the LogEntry rows (on behalf of `user`) and the summary
+    notification, queued only if something was downloaded, are done once
+    all lookups are over.
+    """
     resp = {}
     if not episode_list:
         return resp
-    ct = ContentType.objects.get_for_model(episode_list.model)
+    workers = workers or getattr(settings, "DOWNLOAD_WORKERS", 4)
+    episodes = list(episode_list.select_related("show"))
+    packs = plan_season_packs(episodes, getattr(settings, "SEASON_PACK_THRESHOLD", 4))
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_lookup_episode, f"{show.name} S{season:02d}"): ((show, season), group)
+            for (show, season), group in packs.items()
+        }
+        for future in as_completed(futures):
+            (show, season), group = futures[future]
+            title = future.result()
+            if title:
+                first, last = pack_coverage(title, season) or (1, None)
+                results.update({
+                    episode: title for episode in group
+                    if first <= episode.number and (last is None or episode.number <= last)
+                })
+                # The pack also holds the pending episodes of the season outside this batch
+                covered = Episode.objects.to_download().claimable().filter(
+                    show=show, season=season, number__gte=first,
+                ).exclude(pk__in=[episode.pk for episode in episodes])
+                if last is not None:
+                    covered = covered.filter(number__lte=last)
+                for episode in covered.select_related("show"):
+                    results[episode] = title
+                    episodes.append(episode)
+        futures = {
+            executor.submit(_lookup_episode, str(episode)): episode
+            for episode in episodes if episode not in results
+        }
+        results.update({futures[future]: future.result() for future in as_completed(futures)})
+
     text = "Hello,\nI proudly download:\n"
-    for episode in episode_list:
-        res = lookup(
-            settings.YGG_PATH,
-            str(episode),
-            settings.YGG_PASSKEY,
-            settings.TO_ADD,
-            settings.PREFERD_LANG,
-            settings.PREFERD_RES)
+    downloaded = []
+    for episode in episodes:
+        res = results[episode]
         text += f" * {episode}: {bool(res)}\r\n"
         logger.info(f"Downloaded {episode}: {bool(res)}")
         if res:
             episode.downloaded = True
-            episode.save()
-            LogEntry.objects.log_action(
-                user_id=1,
-                content_type_id=ct.pk,
-                object_id=episode.pk,
-                object_repr=str(episode),
-                action_flag=CHANGE,
-                change_message="The episode has been download")
+            downloaded.append(episode)
         resp[episode] = bool(res)
-    send_mail(
-        'Download resum',
-        text,
-        settings.FROM_EMAIL,
-        settings.TO_EMAIL
-    )
+
+    # False means the tracker had nothing; None is a failed lookup, retried as usual
+    record_lookup_misses([episode for episode in episodes if results[episode] is False])
+    if downloaded:
+        with AuditBuffer(user) as audit, audit.atomic():
+            Episode.objects.filter(pk__in=[episode.pk for episode in downloaded]).update(
+                downloaded=True, lookup_attempts=0, next_lookup_at=None)
+            for episode in downloaded:
+                audit.log(episode, CHANGE, "The episode has been download")
+        refresh_show_stats(episode.show_id for episode in downloaded)
+        notify('Download resum', text)
     return resp
 
 
-def download_by_urls(urls):
-    resp = {}
-    text = "Hello,\nI proudly download:\n"
-    for url in urls:
-        last_part = urlparse(url).path.split('/')[-1]
-        match = re.search(r'\d+', last_part)
-        if not match:
+def download_queue(episode_list=None, batch_size=None, user=None):
+    """
+    Claim and download `episode_list` (the "to download" episodes out of
+    their lookup backoff by default)
+    in batches of `batch_size` (settings.DOWNLOAD_CLAIM_BATCH). Claims are
+    leases, so several hosts can drain the queue at once without fetching
+    the same episode twice; whatever a batch did not download is released.
+    """
+    if episode_list is None:
+        episode_list = Episode.objects.to_download().eligible()
+    batch_size = batch_size or getattr(settings, "DOWNLOAD_CLAIM_BATCH", 20)
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    resp, seen = {}, set()
+    while True:
+        batch = episode_list.exclude(pk__in=seen).claim(owner, limit=batch_size)
+        ids = set(batch.values_list("pk", flat=True))
+        if not ids:
             return resp
+        seen |= ids
+        try:
+            resp.update(download_episode(batch, user=user))
+        finally:
+            Episode.objects.filter(pk__in=ids).release(owner)
+
+
+def plan_season_packs(episodes, threshold):
+    """Group `episodes` by (show, season) and keep the groups of at least `threshold` episodes."""
+    groups = {}
+    for episode in episodes:
+        groups.setdefault((episode.show, episode.season), []).append(episode)
+    if not threshold:
+        return {}
+    return {key: group for key, group in groups.items() if len(group) >= threshold}
+
+
+def lookup_backoff(attempts):
+    """Seconds to wait after `attempts` consecutive misses, doubling up to LOOKUP_BACKOFF_MAX."""
+    base = getattr(settings, "LOOKUP_BACKOFF_BASE", 60 * 60)
+    cap = getattr(settings, "LOOKUP_BACKOFF_MAX", 7 * 24 * 60 * 60)
+    return min(base * 2 ** max(attempts - 1, 0), cap)
+
 
-        torrent_id = match.group()
-        res = lookup(
+def record_lookup_misses(episodes, now=None):
+    """
+    Push back the next lookup of episodes no torrent was found for.
+    The attempt count restarts when the air date moved since the last miss.
+    """
+    now = now or timezone.now()
+    by_attempts = {}
+    for episode in episodes:
+        attempts = episode.lookup_attempts + 1 if episode.lookup_date == episode.date else 1
+        by_attempts.setdefault(attempts, []).append(episode)
+    for attempts, group in by_attempts.items():
+        Episode.objects.filter(pk__in=[episode.pk for episode in group]).update(
+            lookup_attempts=attempts,
+            last_lookup_at=now,
+            next_lookup_at=now + datetime.timedelta(seconds=lookup_backoff(attempts)),
+            lookup_date=F("date"),
+        )
+
+
+def _lookup_episode(name, torrent_id=None):
+    """
+    Run lookup for one episode from a worker thread; a failure only fails
+    that episode and returns None, as opposed to False for "nothing found".
+    """
+    try:
+        return lookup(
             settings.YGG_PATH,
-            "blop",
+            name,
             settings.YGG_PASSKEY,
             settings.TO_ADD,
             settings.PREFERD_LANG,
             settings.PREFERD_RES,
             torrent_id)
-        text += ' * ' + str(res) + ": " + str(bool(res)) + "\r\n"
-        resp[str(res)] = bool(res)
-    send_mail(
-        'Download resum',
-        text,
-        settings.FROM_EMAIL,
-        settings.TO_EMAIL
-    )
-    return resp
+    except Exception as exc:
+        logger.error(f"Lookup failed for {name}: {exc}")
+        return None
+
+
+def download_by_urls(urls, workers=None):
+    """
+    Download the torrents pointed at by tracker `urls`, running up to
+    `workers` (settings.DOWNLOAD_WORKERS) lookups at once.
+    Every URL is validated first and gets a result: the downloaded title,
+    or False when the URL has no torrent id or the download failed.
+    """
+    resp = {}
+    torrent_ids = {}
+    for url in urls:
+        match = re.search(r'\d+', urlparse(url).path.split('/')[-1])
+        if match:
+            torrent_ids[url] = match.group()
+        else:
+            logger.warning(f"No torrent id in {url}")
+            resp[url] = False
+    if torrent_ids:
+        workers = workers or getattr(settings, "DOWNLOAD_WORKERS", 4)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(_lookup_episode, url, torrent_id): url
+                for url, torrent_id in torrent_ids.items()
+            }
+            resp.update({futures[future]: future.result() or False for future in as_completed(futures)})
+
+    if any(resp.values()):
+        text = "Hello,\nI proudly download:\n"
+        for url in urls:
+            text += f" * {resp[url] or url}: {bool(resp[url])}\r\n"
+        notify('Download resum', text)
+    return {url: resp[url] for url in urls}
 
 
 def lookup(path, name, passkey, toAdd, language, resolution, torrent_id=None):
     if torrent_id:
-        torrent = requests.get(f'{path}/torrent/{torrent_id}').json()
+        torrent = http_client.get(f'{path}/torrent/{torrent_id}').json()
     else:
-        # Search Torrent
-        search_queries = [
-            f"{name} {language} {resolution}",
-            f"{name} {language}",
-            f"{name} {resolution}",
-            f"{name}"
-        ]
-
-        torrents = None
-        for query in search_queries:
-            params = {'q': query, 'order_by': 'downloads'}
-            torrents = requests.get(f'{path}/torrents', params=params).json()
-
-            if torrents:  # Stop when we find results
-                break
-
-        # Get the ID
-        torrent_id = None
-        for torrent in torrents:
-            if torrent['seeders'] > 0:
-                torrent_id = torrent['id']
-                break
+        # Fetch the broad result set once and rank it locally
+        torrent = pick_best(search_torrents(path, name), name, language, resolution)
+        torrent_id = torrent['id'] if torrent else None
 
     if torrent_id and torrent:
         title = safe_filename(torrent['title'])
-        # Download and save fake torrent file
+        # Download the torrent with a fake passkey and put the right one back in memory
         fake_pass = ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(32))
-
-        params = {'passkey': fake_pass}
-        response = requests.get(f'{path}/torrent/{torrent_id}/download', params=params, stream=True)
-        os.makedirs(settings.TEMP_DIR, exist_ok=True)
-        with open(f"{settings.TEMP_DIR}/{title}.torrent", 'wb') as file:
-            for chunk in response.iter_content(1024):
-                file.write(chunk)
-        # Open and edit with right passkey
-        data = torrent_parser.parse_torrent_file(f"{settings.TEMP_DIR}/{title}.torrent")
-        data['announce'] = data['announce'].replace(fake_pass, passkey)
-        torrent_parser.create_torrent_file(f"{toAdd}/{title}.torrent", data)
+        content = download_torrent(f'{path}/torrent/{torrent_id}/download', params={'passkey': fake_pass})
+        write_atomic(toAdd, f"{title}.torrent", rewrite_announce(content, fake_pass, passkey))
         return title
     return False
 
 
-def create_or_update_with_log(model, defaults=None, **lookup):
+def search_torrents(path, query, order_by="downloads"):
+    """
+    Search the tracker. Results, empty ones included but not errors, are kept for
+    SEARCH_CACHE_TTL seconds in the SEARCH_CACHE_ALIAS cache, keyed by the
+    normalized query and ordering, so pending episodes don't repeat searches.
+    """
+    normalized = " ".join(query.lower().split())
+    key = "torrent_search::" + hashlib.sha256(f"{path}|{normalized}|{order_by}".encode()).hexdigest()
+    search_cache = caches[getattr(settings, "SEARCH_CACHE_ALIAS", "default")]
+    torrents = search_cache.get(key)
+    if torrents is None:
+        params = {'q': query, 'order_by': order_by}
+        response = http_client.get(f'{path}/torrents', params=params)
+        # Failed searches raise instead of being cached as results
+        response.raise_for_status()
+        torrents = response.json() or []
+        if not isinstance(torrents, list):
+            raise ValueError(f"Unexpected search response for {query!r}: {torrents!r}")
+        search_cache.set(key, torrents, getattr(settings, "SEARCH_CACHE_TTL", 3600))
+    return torrents
+
+
+def create_or_update_with_log(model, defaults=None, audit=None, **lookup):
     """
     Create if not exists, or update if changed.
-    Logs both to standard logger and Django admin LogEntry.
+    Logs both to standard logger and Django admin LogEntry, through `audit`
+    when given (an AuditBuffer) or else written right away.
     """
+    if audit is None:
+        with AuditBuffer() as audit:
+            return create_or_update_with_log(model, defaults, audit=audit, **lookup)
     defaults = defaults or {}
 
     obj, created = model.objects.get_or_create(defaults=defaults, **lookup)
@@ -199,14 +502,7 @@ def create_or_update_with_log(model, defaults=None, **lookup):
         logger.info(f"Created new {model_name}: {obj_str}")
 
         # Django admin log
-        LogEntry.objects.log_action(
-            user_id=1,
-            content_type_id=ContentType.objects.get_for_model(model).pk,
-            object_id=obj.pk,
-            object_repr=obj_str,
-            action_flag=ADDITION,
-            change_message=f"Created new {model_name}"
-        )
+        audit.log(obj, ADDITION, f"Created new {model_name}")
 
         return obj, True
 
@@ -228,40 +524,72 @@ def create_or_update_with_log(model, defaults=None, **lookup):
         logger.info(f"Updated {model_name} '{obj_str}' changes: {changes}")
 
         # Django admin log
-        LogEntry.objects.log_action(
-            user_id=1,
-            content_type_id=ContentType.objects.get_for_model(model).pk,
-            object_id=obj.pk,
-            object_repr=obj_str,
-            action_flag=CHANGE,
-            change_message=f"Updated fields: {changes}"
-        )
+        audit.log(obj, CHANGE, f"Updated fields: {changes}")
     else:
         logger.debug(f"No changes detected for {model_name} '{obj_str}'")
 
     return obj, created
 
 
-def send_mail(subject, body, from_email, to_email):
-    mailjet = Client(auth=(settings.MAILJET_API_KEY, settings.MAILJET_API_SECRET), version='v3.1')
-    to = []
-    for mail in to_email:
-        to.append({"Email": mail})
-
-    data = {
-        'Messages': [
-            {
-                "From": {
-                    "Email": from_email,
-                },
-                "To": to,
-                "Subject": subject,
-                "TextPart": body,
-                "CustomID": "FetcherNotification"
-            }
-        ]
-    }
-    return mailjet.send.create(data=data)
+def bulk_create_or_update_with_log(model, rows, audit=None):
+    """
+    Set-based counterpart of create_or_update_with_log.
+    `rows` maps primary keys to the field values to store. Existing objects are
+    loaded in one query and diffed in memory, then the changes are written with
+    bulk_create/bulk_update in one transaction and their LogEntry rows go to
+    `audit` (an AuditBuffer), or are written right after when none is given.
+    Returns the lists of created and updated objects.
+    """
+    if audit is None:
+        with AuditBuffer() as audit:
+            return bulk_create_or_update_with_log(model, rows, audit=audit)
+    model_name = model.__name__
+    existing = model.objects.in_bulk(list(rows))
+
+    created, updated, updated_fields, entries = [], [], set(), []
+    for pk, defaults in rows.items():
+        obj = existing.get(pk)
+        if obj is None:
+            obj = model(pk=pk, **defaults)
+            created.append(obj)
+            logger.info(f"Created new {model_name}: {force_str(obj)}")
+            entries.append((obj, ADDITION, f"Created new {model_name}"))
+            continue
+
+        changes = {}
+        for field, new_value in defaults.items():
+            model_field = model._meta.get_field(field)
+            if model_field.is_relation:
+                # Compare on the raw id so existing rows don't fetch their relation
+                old_value = getattr(obj, model_field.attname)
+                new_id = getattr(new_value, "pk", new_value)
+                if old_value != new_id:
+                    changes[field] = {'old': old_value, 'new': new_id}
+                setattr(obj, field, new_value)
+                continue
+            old_value = getattr(obj, field)
+            if old_value != new_value:
+                setattr(obj, field, new_value)
+                changes[field] = {'old': old_value, 'new': new_value}
+
+        obj_str = force_str(obj)
+        if changes:
+            updated.append(obj)
+            updated_fields.update(changes)
+            logger.info(f"Updated {model_name} '{obj_str}' changes: {changes}")
+            entries.append((obj, CHANGE, f"Updated fields: {changes}"))
+        else:
+            logger.debug(f"No changes detected for {model_name} '{obj_str}'")
+
+    with audit.atomic():
+        if created:
+            model.objects.bulk_create(created)
+        if updated:
+            model.objects.bulk_update(updated, sorted(updated_fields))
+        for obj, action_flag, message in entries:
+            audit.log(obj, action_flag, message)
+
+    return created, updated
 
 
 def safe_filename(name):
@@ -271,11 +599,3 @@ def safe_filename(name):
     # Remove unsafe characters
     name = re.sub(r'[^a-zA-Z0-9._\-]', '_', name)
     return name
-
-
-def print_messages(request, resp):
-    for name, result in resp.items():
-        if result:
-            messages.info(request, f"{name}: {result}")
-        else:
-            messages.error(request, f"{name}: {result}")
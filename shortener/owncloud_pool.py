@@ -0,0 +1,117 @@
+"""
+Pool of logged-in OwnCloud clients shared by the shortener views.
+
+Logging in costs a capabilities round trip, so clients are kept logged in and
+reused across requests instead of being built per view. A client is checked
+out by one thread at a time, at most OC_POOL_SIZE of them exist per process,
+and those left unused for OC_POOL_IDLE_TIMEOUT seconds are closed. A client
+whose session the server rejects (401) is dropped and run() retries the call
+once with a newly logged-in one.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import owncloud
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class SessionExpired(Exception):
+    """Raised by ClientPool.client() when the server rejected the session."""
+
+
+class ClientPool:
+    def __init__(self, size=None, idle_timeout=None):
+        self.size = size or getattr(settings, "OC_POOL_SIZE", 10)
+        self.idle_timeout = idle_timeout or getattr(settings, "OC_POOL_IDLE_TIMEOUT", 5 * 60)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+
+    @contextmanager
+    def client(self, fresh=False):
+        """
+        Check out a logged-in client, blocking while all of them are in use.
+        A `fresh` client is logged in for the occasion instead of taken from the idle ones.
+        """
+        with self._slots:
+            oc = self._login() if fresh else self._checkout()
+            try:
+                yield oc
+            except owncloud.ResponseError as exc:
+                if exc.status_code == 401:
+                    # Do not hand the rejected session out again
+                    self._close(oc)
+                    raise SessionExpired(str(exc)) from exc
+                self._checkin(oc)
+                raise
+            except BaseException:
+                self._checkin(oc)
+                raise
+            self._checkin(oc)
+
+    def run(self, func, *args, **kwargs):
+        """Call func(client, *args, **kwargs), logging in again once if the session expired."""
+        try:
+            with self.client() as oc:
+                return func(oc, *args, **kwargs)
+        except SessionExpired:
+            logger.info("OwnCloud session expired, logging in again")
+        # The idle clients may have expired as well
+        with self.client(fresh=True) as oc:
+            return func(oc, *args, **kwargs)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for oc, _ in idle:
+            self._close(oc)
+
+    def _checkout(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [oc for oc, last_used in self._idle if now - last_used > self.idle_timeout]
+            self._idle = [(oc, last_used) for oc, last_used in self._idle if now - last_used <= self.idle_timeout]
+            oc = self._idle.pop()[0] if self._idle else None
+        for stale in expired:
+            self._close(stale)
+        return oc or self._login()
+
+    def _login(self):
+        oc = owncloud.Client(settings.OC_SERVER)
+        oc.login(settings.OC_USER, settings.OC_PASSWORD)
+        return oc
+
+    def _checkin(self, oc):
+        with self._lock:
+            self._idle.append((oc, time.monotonic()))
+
+    def _close(self, oc):
+        try:
+            oc.logout()
+        except Exception as exc:
+            logger.warning(f"Failed to close OwnCloud session: {exc}")
+
+
+def get_pool():
+    """Return the process-wide client pool, building it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ClientPool()
+        return _pool
+
+
+def reset_pool():
+    """Close the pooled clients so the next call rebuilds the pool from settings."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = None
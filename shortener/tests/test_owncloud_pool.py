@@ -0,0 +1,96 @@
+import threading
+from unittest.mock import MagicMock, patch
+
+import owncloud
+from django.test import TestCase, override_settings
+
+from shortener.owncloud_pool import ClientPool, SessionExpired, get_pool, reset_pool
+
+
+def expired():
+    return owncloud.HTTPResponseError(401)
+
+
+@patch("shortener.owncloud_pool.owncloud.Client")
+class ClientPoolTest(TestCase):
+    def test_client_is_logged_in_once_and_reused(self, mock_client):
+        pool = ClientPool(size=2)
+        with pool.client() as first:
+            pass
+        with pool.client() as second:
+            pass
+        self.assertIs(first, second)
+        mock_client.assert_called_once_with("https://test-oc.example.com")
+        first.login.assert_called_once_with("test_oc_user", "test_oc_pass")
+
+    def test_concurrent_checkouts_get_distinct_clients(self, mock_client):
+        mock_client.side_effect = lambda url: MagicMock()
+        pool = ClientPool(size=2)
+        with pool.client() as first, pool.client() as second:
+            self.assertIsNot(first, second)
+
+    def test_checkout_blocks_when_pool_is_exhausted(self, mock_client):
+        pool = ClientPool(size=1)
+        got_client = threading.Event()
+        with pool.client():
+            thread = threading.Thread(target=lambda: pool.run(lambda oc: got_client.set()))
+            thread.start()
+            self.assertFalse(got_client.wait(0.05))
+        thread.join(1)
+        self.assertTrue(got_client.is_set())
+
+    def test_expired_session_is_dropped_and_call_retried(self, mock_client):
+        stale, fresh = MagicMock(), MagicMock()
+        mock_client.side_effect = [stale, fresh]
+        stale.list.side_effect = expired()
+        fresh.list.return_value = ["file"]
+        pool = ClientPool(size=1)
+        self.assertEqual(pool.run(lambda oc: oc.list("Local")), ["file"])
+        stale.logout.assert_called_once()
+        with pool.client() as oc:
+            self.assertIs(oc, fresh)
+
+    def test_retry_does_not_reuse_idle_clients(self, mock_client):
+        stale_a, stale_b, fresh = MagicMock(), MagicMock(), MagicMock()
+        mock_client.side_effect = [stale_a, stale_b, fresh]
+        for stale in (stale_a, stale_b):
+            stale.list.side_effect = expired()
+        fresh.list.return_value = ["file"]
+        pool = ClientPool(size=2)
+        with pool.client(), pool.client():
+            pass
+        self.assertEqual(pool.run(lambda oc: oc.list("Local")), ["file"])
+        fresh.login.assert_called_once()
+
+    def test_second_rejection_is_raised(self, mock_client):
+        mock_client.return_value.list.side_effect = expired()
+        with self.assertRaises(SessionExpired):
+            ClientPool(size=1).run(lambda oc: oc.list("Local"))
+
+    def test_other_errors_keep_the_client(self, mock_client):
+        mock_client.return_value.list.side_effect = owncloud.HTTPResponseError(404)
+        pool = ClientPool(size=1)
+        with self.assertRaises(owncloud.HTTPResponseError):
+            pool.run(lambda oc: oc.list("Missing"))
+        with pool.client():
+            pass
+        mock_client.assert_called_once()
+
+    @patch("shortener.owncloud_pool.time.monotonic")
+    def test_idle_clients_are_closed(self, mock_monotonic, mock_client):
+        mock_client.side_effect = lambda url: MagicMock()
+        pool = ClientPool(size=1, idle_timeout=60)
+        mock_monotonic.return_value = 0
+        with pool.client() as first:
+            pass
+        mock_monotonic.return_value = 61
+        with pool.client() as second:
+            self.assertIsNot(first, second)
+        first.logout.assert_called_once()
+
+    @override_settings(OC_POOL_SIZE=3, OC_POOL_IDLE_TIMEOUT=30)
+    def test_get_pool_is_shared_and_built_from_settings(self, mock_client):
+        reset_pool()
+        self.assertIs(get_pool(), get_pool())
+        self.assertEqual((get_pool().size, get_pool().idle_timeout), (3, 30))
+        reset_pool()
@@ -1,9 +1,14 @@
+import threading
+import time
+from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
 
 from django.core.cache import cache
-from django.test import RequestFactory, TestCase
+from django.test import RequestFactory, TestCase, override_settings
 from django.urls import reverse
+from owncloud import ShareInfo
 
+from shortener.owncloud_pool import reset_pool
 from shortener.views import (
     home_view,
     list_view,
@@ -12,6 +17,10 @@ from shortener.views import (
     refresh_view,
     _cache_key_for_path,
     _invalidate_cache,
+    _refresh_in_background,
+    _short_url_index,
+    OC_SHARES_KEY,
+    YOURLS_INDEX_KEY,
 )
 
 
@@ -25,11 +34,12 @@ class HomeViewTest(TestCase):
 
 class ListViewTest(TestCase):
     def setUp(self):
+        reset_pool()
         self.factory = RequestFactory()
 
     @patch("shortener.views.cache.set")
     @patch("shortener.views.YOURLSClient")
-    @patch("shortener.views.owncloud.Client")
+    @patch("shortener.owncloud_pool.owncloud.Client")
     def test_list_view_returns_context_with_path_and_files(self, mock_oc_client, mock_yourls, mock_cache_set):
         mock_oc = MagicMock()
         mock_oc_client.return_value = mock_oc
@@ -52,7 +62,7 @@ class ListViewTest(TestCase):
     def test_list_view_uses_cache_when_available(self):
         cache_key = _cache_key_for_path("Local")
         cached = {"path": "Local", "prev_path": "Local", "list_of_files": []}
-        cache.set(cache_key, cached, timeout=60)
+        cache.set(cache_key, {"context": cached, "built_at": time.time()}, timeout=60)
         request = self.factory.get("/list/")
         response = list_view(request, path="Local")
         self.assertEqual(response.status_code, 200)
@@ -60,12 +70,117 @@ class ListViewTest(TestCase):
         cache.delete(cache_key)
 
 
+class ShortUrlIndexTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_pool()
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        cache.clear()
+
+    @patch("shortener.views.YOURLSClient")
+    def test_index_is_fetched_once_and_keeps_first_entry(self, mock_yourls):
+        mock_yourls.return_value.list.return_value = [
+            MagicMock(url="https://oc/s/a", shorturl="https://short/a", keyword="a"),
+            MagicMock(url="https://oc/s/a", shorturl="https://short/a2", keyword="a2"),
+            MagicMock(url="https://oc/s/b", shorturl="https://short/b", keyword="b"),
+        ]
+        index = _short_url_index()
+        self.assertEqual(index["https://oc/s/a"], {"shorturl": "https://short/a", "keyword": "a"})
+        self.assertEqual(len(index), 2)
+        _short_url_index()
+        mock_yourls.return_value.list.assert_called_once()
+
+    @patch("shortener.views.YOURLSClient")
+    @patch("shortener.owncloud_pool.owncloud.Client")
+    def test_list_view_reads_index(self, mock_oc_client, mock_yourls):
+        cache.set(YOURLS_INDEX_KEY, {"https://oc/s/a": {"shorturl": "https://short/a", "keyword": "a"}})
+        mock_file = SimpleNamespace(path="Local/a.txt", attributes={})
+        mock_oc_client.return_value.list.return_value = [mock_file]
+        mock_oc_client.return_value.get_shares.return_value = [
+            ShareInfo({"id": "1", "path": "/Local/a.txt", "url": "https://oc/s/a"}),
+        ]
+        list_view(self.factory.get("/list/"), path="Local")
+        self.assertEqual(mock_file.attributes, {"short": "https://short/a", "keyword": "a"})
+        mock_yourls.return_value.list.assert_not_called()
+
+    @patch("shortener.views.YOURLSClient")
+    @patch("shortener.owncloud_pool.owncloud.Client")
+    def test_shorten_and_delete_patch_index(self, mock_oc_client, mock_yourls):
+        cache.set(YOURLS_INDEX_KEY, {})
+        mock_oc_client.return_value.get_shares.return_value = [MagicMock(share_info={"url": "https://oc/s/c"})]
+        mock_yourls.return_value.shorten.return_value = MagicMock(shorturl="https://short/c", keyword="c")
+        shorten_view(self.factory.post("/shorten", data={"path": "Local/c.txt", "txt": "c"}))
+        self.assertEqual(cache.get(YOURLS_INDEX_KEY), {"https://oc/s/c": {"shorturl": "https://short/c", "keyword": "c"}})
+
+        delete_view(self.factory.get("/delete/c"), keyword="c")
+        self.assertEqual(cache.get(YOURLS_INDEX_KEY), {})
+        mock_yourls.return_value.list.assert_not_called()
+
+
+class ShareIndexTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_pool()
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        cache.clear()
+
+    @patch("shortener.views.YOURLSClient")
+    @patch("shortener.owncloud_pool.owncloud.Client")
+    def test_shares_fetched_once_for_all_directories(self, mock_oc_client, mock_yourls):
+        oc = mock_oc_client.return_value
+        oc.get_shares.return_value = [
+            ShareInfo({"id": "1", "path": "/Local/a.txt", "share_type": "3", "url": "https://oc/s/a"}),
+            ShareInfo({"id": "2", "path": "/Local/sub/b.txt", "share_type": "3", "url": "https://oc/s/b"}),
+            ShareInfo({"id": "3", "path": "/Local/sub/c.txt", "share_type": "0", "share_with": "bob"}),
+        ]
+        mock_yourls.return_value.list.return_value = [
+            SimpleNamespace(url="https://oc/s/b", shorturl="https://short/b", keyword="b"),
+        ]
+        oc.list.return_value = [SimpleNamespace(path="/Local/a.txt", attributes={})]
+        list_view(self.factory.get("/list/"), path="Local")
+        files = [SimpleNamespace(path="/Local/sub/b.txt", attributes={}),
+                 SimpleNamespace(path="/Local/sub/c.txt", attributes={})]
+        oc.list.return_value = files
+        list_view(self.factory.get("/list/Local/sub"), path="Local/sub")
+
+        oc.get_shares.assert_called_once_with()
+        self.assertEqual(files[0].attributes, {"short": "https://short/b", "keyword": "b"})
+        self.assertEqual(files[1].attributes, {})
+
+    @patch("shortener.views.YOURLSClient")
+    @patch("shortener.owncloud_pool.owncloud.Client")
+    def test_share_errors_are_reported_on_files(self, mock_oc_client, mock_yourls):
+        mock_yourls.return_value.list.return_value = []
+        mock_oc_client.return_value.get_shares.side_effect = RuntimeError("OCS down")
+        file = SimpleNamespace(path="/Local/a.txt", attributes={})
+        mock_oc_client.return_value.list.return_value = [file]
+        response = list_view(self.factory.get("/list/"), path="Local")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(file.attributes, {"error": "OCS down"})
+
+    @patch("shortener.views.YOURLSClient")
+    @patch("shortener.owncloud_pool.owncloud.Client")
+    def test_shorten_records_new_share(self, mock_oc_client, mock_yourls):
+        cache.set(OC_SHARES_KEY, {})
+        oc = mock_oc_client.return_value
+        oc.get_shares.return_value = []
+        oc.share_file_with_link.return_value.get_link.return_value = "https://oc/s/new"
+        mock_yourls.return_value.shorten.return_value = SimpleNamespace(shorturl="https://short/n", keyword="n")
+        shorten_view(self.factory.post("/shorten", data={"path": "/Local/new.txt", "txt": "n"}))
+        self.assertEqual(cache.get(OC_SHARES_KEY), {"Local/new.txt": "https://oc/s/new"})
+
+
 class ShortenViewTest(TestCase):
     def setUp(self):
+        reset_pool()
         self.factory = RequestFactory()
 
     @patch("shortener.views.YOURLSClient")
-    @patch("shortener.views.owncloud.Client")
+    @patch("shortener.owncloud_pool.owncloud.Client")
     def test_shorten_view_creates_short_link(self, mock_oc_client, mock_yourls):
         mock_oc = MagicMock()
         mock_oc_client.return_value = mock_oc
@@ -106,12 +221,114 @@ class DeleteViewTest(TestCase):
         self.assertIsNone(cache.get(cache_key))
 
 
+class StaleWhileRevalidateTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.cache_key = _cache_key_for_path("Local")
+
+    def tearDown(self):
+        cache.clear()
+
+    def stale_entry(self):
+        context = {"path": "Local", "prev_path": "Local", "list_of_files": []}
+        return {"context": context, "built_at": time.time() - 120}
+
+    @patch("shortener.views._build_list_context")
+    def test_fresh_listing_is_served_without_rebuild(self, mock_build):
+        cache.set(self.cache_key, {"context": self.stale_entry()["context"], "built_at": time.time()})
+        list_view(self.factory.get("/list/"), path="Local")
+        mock_build.assert_not_called()
+
+    @override_settings(OC_LIST_TTL=60)
+    @patch("shortener.views._build_list_context")
+    def test_stale_listing_is_served_and_rebuilt_once(self, mock_build):
+        cache.set(self.cache_key, self.stale_entry())
+        release = threading.Event()
+        mock_build.side_effect = lambda path: release.wait(1)
+        threads = []
+
+        def refresh(path):
+            threads.append(_refresh_in_background(path))
+
+        with patch("shortener.views._refresh_in_background", side_effect=refresh):
+            for _ in range(3):
+                response = list_view(self.factory.get("/list/"), path="Local")
+                self.assertEqual(response.status_code, 200)
+        release.set()
+        # Only the first stale hit got the lock, the others served the stale listing
+        self.assertIsNotNone(threads[0])
+        self.assertEqual(threads[1:], [None, None])
+        threads[0].join(1)
+        mock_build.assert_called_once_with("Local")
+
+    @patch("shortener.views._build_list_context")
+    def test_lock_is_released_after_rebuild(self, mock_build):
+        mock_build.side_effect = RuntimeError("OwnCloud down")
+        _refresh_in_background("Local").join(1)
+        _refresh_in_background("Local").join(1)
+        self.assertEqual(mock_build.call_count, 2)
+
+    @patch("shortener.views._build_list_context")
+    def test_concurrent_misses_build_once(self, mock_build):
+        def build(path):
+            time.sleep(0.1)
+            cache.set(self.cache_key, self.stale_entry())
+            return self.stale_entry()["context"]
+
+        mock_build.side_effect = build
+        responses = []
+        threads = [
+            threading.Thread(target=lambda: responses.append(list_view(self.factory.get("/list/"), path="Local")))
+            for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(2)
+        self.assertEqual([response.status_code for response in responses], [200, 200, 200])
+        mock_build.assert_called_once_with("Local")
+
+    @patch("shortener.views.LIST_WAIT_TIMEOUT", 0)
+    @patch("shortener.views._build_list_context")
+    def test_builds_anyway_when_lock_holder_is_stuck(self, mock_build):
+        cache.add(f"{self.cache_key}::refresh", "other")
+        mock_build.return_value = self.stale_entry()["context"]
+        list_view(self.factory.get("/list/"), path="Local")
+        mock_build.assert_called_once_with("Local")
+        # The lock of the other holder is left alone
+        self.assertEqual(cache.get(f"{self.cache_key}::refresh"), "other")
+
+    @patch("shortener.views.YOURLSClient")
+    @patch("shortener.owncloud_pool.owncloud.Client")
+    def test_expired_listing_is_rebuilt_in_request(self, mock_oc_client, mock_yourls):
+        reset_pool()
+        mock_oc_client.return_value.list.return_value = []
+        mock_oc_client.return_value.get_shares.return_value = []
+        mock_yourls.return_value.list.return_value = []
+        list_view(self.factory.get("/list/"), path="Local")
+        self.assertEqual(cache.get(self.cache_key)["context"]["path"], "Local")
+
+
 class RefreshViewTest(TestCase):
-    def test_refresh_view_invalidates_cache_and_redirects(self):
+    def tearDown(self):
+        cache.clear()
+
+    @patch("shortener.views.YOURLSClient")
+    @patch("shortener.owncloud_pool.owncloud.Client")
+    def test_refresh_view_rebuilds_cache_and_redirects(self, mock_oc_client, mock_yourls):
+        reset_pool()
         cache_key = _cache_key_for_path("Local")
-        cache.set(cache_key, {"path": "Local"}, timeout=60)
+        cache.set(cache_key, {"context": {"path": "Local"}, "built_at": 0}, timeout=60)
+        cache.set(YOURLS_INDEX_KEY, {"https://oc/s/old": {"shorturl": "https://short/old", "keyword": "old"}})
+        mock_oc_client.return_value.list.return_value = []
+        mock_oc_client.return_value.get_shares.return_value = []
+        mock_yourls.return_value.list.return_value = []
         request = RequestFactory().get("/refresh/")
         response = refresh_view(request, path="Local")
         self.assertEqual(response.status_code, 302)
         self.assertIn("list", response.url)
-        self.assertIsNone(cache.get(cache_key))
+        self.assertGreater(cache.get(cache_key)["built_at"], 0)
+        # The catalogues are refetched, not reused
+        mock_yourls.return_value.list.assert_called_once()
+        self.assertEqual(cache.get(YOURLS_INDEX_KEY), {})
@@ -1,10 +1,12 @@
 import json
+import logging
 import string
 import random
-from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import uuid
 from pathlib import Path
 
-import owncloud
 from django.conf import settings
 from django.core.cache import cache
 from django.shortcuts import redirect, render
@@ -12,6 +14,18 @@ from django.shortcuts import redirect, render
 from yourls import YOURLSClient
 from yourls.exceptions import YOURLSHTTPError
 
+from shortener.owncloud_pool import get_pool
+
+OC_SHARES_KEY = "owncloud_shares"
+YOURLS_INDEX_KEY = "yourls_index"
+# A rebuild that died leaves the listing to be refreshed again after this long
+REFRESH_LOCK_TIMEOUT = 5 * 60
+# How long a request waits for another one to build the listing it needs
+LIST_WAIT_TIMEOUT = 30
+LIST_WAIT_POLL = 0.05
+
+logger = logging.getLogger(__name__)
+
 
 def home_view(request):
     return redirect(list_view)
@@ -20,50 +34,19 @@ def home_view(request):
 def list_view(request, path=settings.OC_PATH):
     """
     List files in OwnCloud with YOURLS short URLs.
-    Uses threading to fetch shares concurrently and caches per directory for 30s.
+    A directory listing is fresh for OC_LIST_TTL seconds. After that it is still
+    served while a single background thread rebuilds it, until it expires for
+    good after OC_LIST_MAX_AGE seconds; then one request rebuilds it and the
+    concurrent ones wait for its result.
     Cache is invalidated when a share is created or deleted within that directory.
     """
-    cache_key = _cache_key_for_path(path)
-    cached_context = cache.get(cache_key)
-    if cached_context:
-        return render(request, "shortener/index.html", cached_context)
-
-    # Connect to OwnCloud
-    oc = owncloud.Client(settings.OC_SERVER)
-    oc.login(settings.OC_USER, settings.OC_PASSWORD)
-    list_of_files = oc.list(path)
-
-    # Connect to YOURLS and preload existing short URLs
-    yourls = YOURLSClient(settings.YOURLS_ENDPOINT, signature=settings.YOURLS_SIGNATURE)
-    list_of_short = yourls.list()
-
-    def fetch_share(file):
-        """Fetch share info + YOURLS mapping for one file."""
-        try:
-            shares = oc.get_shares(path=file.path)
-            if not shares:
-                return file
-            share_url = shares[0].share_info["url"]
-            short_entry = next((x for x in list_of_short if x.url == share_url), None)
-            if short_entry:
-                file.attributes["short"] = short_entry.shorturl
-                file.attributes["keyword"] = short_entry.keyword
-        except Exception as e:
-            file.attributes["error"] = str(e)
-        return file
-
-    # Fetch concurrently
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        list_of_files = list(executor.map(fetch_share, list_of_files))
-
-    context = {
-        "path": path,
-        "prev_path": get_prev_path(path),
-        "list_of_files": list_of_files,
-    }
-
-    # Cache for 30 seconds
-    cache.set(cache_key, context, timeout=60)
+    cached = cache.get(_cache_key_for_path(path))
+    if cached is None:
+        context = _build_or_wait(path)
+    else:
+        context = cached["context"]
+        if time.time() - cached["built_at"] > getattr(settings, "OC_LIST_TTL", 60):
+            _refresh_in_background(path)
     return render(request, "shortener/index.html", context)
 
 
@@ -73,6 +56,7 @@ def delete_view(request, keyword):
     """
     yourls = YOURLSClient(settings.YOURLS_ENDPOINT, signature=settings.YOURLS_SIGNATURE)
     yourls.delete(keyword)
+    _unindex_short_url(keyword)
 
     # Optionally invalidate cache (cannot infer path from keyword directly)
     # If you include a 'path' parameter in delete requests, uncomment below:
@@ -91,22 +75,20 @@ def shorten_view(request):
     txt = request.POST["txt"].lower() if request.POST["txt"] else get_random_string(5)
     path = request.POST["path"]
 
-    oc = owncloud.Client(settings.OC_SERVER)
-    oc.login(settings.OC_USER, settings.OC_PASSWORD)
-
-    share = oc.get_shares(path=path)
-
-    if share:
-        link = share[0].share_info["url"]
-    else:
-        link = oc.share_file_with_link(path).get_link()
+    link = get_pool().run(_share_link, path)
+    _index_share(path, link)
 
     try:
         yourls = YOURLSClient(settings.YOURLS_ENDPOINT, signature=settings.YOURLS_SIGNATURE)
-        shorturl = yourls.shorten(link, keyword=txt).shorturl
+        short = yourls.shorten(link, keyword=txt)
+        shorturl = short.shorturl
+        _index_short_url(link, short.shorturl, short.keyword or txt)
     except YOURLSHTTPError as exc:
         response = json.loads(exc.response._content.decode())
         shorturl = response.get("shorturl", f"ERROR keyword: {txt} already exists")
+        if "shorturl" in response and isinstance(response.get("url"), dict):
+            # The link was already shortened: make sure the index knows it
+            _index_short_url(link, shorturl, response["url"].get("keyword"))
 
     # Invalidate only the parent directory cache
     parent_path = str(Path(path).parent)
@@ -122,7 +104,9 @@ def shorten_view(request):
 
 
 def refresh_view(request, path=settings.OC_PATH):
-    _invalidate_cache(path)
+    """Rebuild the listing of `path` from fresh share and short URL catalogues."""
+    cache.delete_many([OC_SHARES_KEY, YOURLS_INDEX_KEY])
+    _build_list_context(path)
     return redirect('list', path=path)
 
 # ---------------------- helpers ---------------------- #
@@ -139,6 +123,166 @@ def _invalidate_cache(path: str):
     cache.delete(cache_key)
 
 
+def _share_link(oc, path):
+    """Return the public link of `path`, sharing it first if needed."""
+    share = oc.get_shares(path=path)
+    if share:
+        return share[0].share_info["url"]
+    return oc.share_file_with_link(path).get_link()
+
+
+def _build_list_context(path):
+    """Build the listing context of `path` and cache it."""
+    # OwnCloud clients come logged in from the process-wide pool
+    list_of_files = get_pool().run(lambda oc: oc.list(path))
+
+    # Existing short URLs, indexed by long URL
+    short_index = _short_url_index()
+
+    try:
+        share_index = _share_index()
+    except Exception as e:
+        share_index = {}
+        for file in list_of_files:
+            file.attributes["error"] = str(e)
+
+    for file in list_of_files:
+        share_url = share_index.get(_share_key(file.path))
+        short_entry = short_index.get(share_url)
+        if short_entry:
+            file.attributes["short"] = short_entry["shorturl"]
+            file.attributes["keyword"] = short_entry["keyword"]
+
+    context = {
+        "path": path,
+        "prev_path": get_prev_path(path),
+        "list_of_files": list_of_files,
+    }
+    cache.set(
+        _cache_key_for_path(path),
+        {"context": context, "built_at": time.time()},
+        timeout=getattr(settings, "OC_LIST_MAX_AGE", 60 * 60),
+    )
+    return context
+
+
+def _build_or_wait(path):
+    """
+    Build the listing of `path` under its rebuild lock. Without the lock, wait
+    up to LIST_WAIT_TIMEOUT for the holder to cache the listing, then build it anyway.
+    """
+    cache_key = _cache_key_for_path(path)
+    token = _take_rebuild_lock(path)
+    deadline = time.monotonic() + LIST_WAIT_TIMEOUT
+    while token is None and time.monotonic() < deadline:
+        time.sleep(LIST_WAIT_POLL)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached["context"]
+        token = _take_rebuild_lock(path)
+    try:
+        return _build_list_context(path)
+    finally:
+        if token is not None:
+            _release_rebuild_lock(path, token)
+
+
+def _refresh_in_background(path):
+    """
+    Rebuild the listing of `path` in a thread, unless another request is already
+    rebuilding it. Returns the thread, or None when the rebuild was left to another.
+    """
+    token = _take_rebuild_lock(path)
+    if token is None:
+        return None
+
+    def refresh():
+        try:
+            _build_list_context(path)
+        except Exception as e:
+            logger.warning(f"Failed to refresh the listing of {path}: {e}")
+        finally:
+            _release_rebuild_lock(path, token)
+
+    thread = threading.Thread(target=refresh, daemon=True)
+    thread.start()
+    return thread
+
+
+def _take_rebuild_lock(path):
+    """Take the rebuild lock of `path`; return its token, or None if it is held."""
+    token = uuid.uuid4().hex
+    if cache.add(f"{_cache_key_for_path(path)}::refresh", token, timeout=REFRESH_LOCK_TIMEOUT):
+        return token
+    return None
+
+
+def _release_rebuild_lock(path, token):
+    # A rebuild slower than REFRESH_LOCK_TIMEOUT no longer owns the lock
+    lock_key = f"{_cache_key_for_path(path)}::refresh"
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+def _share_key(path):
+    return path.strip("/")
+
+
+def _share_index():
+    """
+    Return the public link of every shared path of the OwnCloud user as
+    {path: url}, fetched in one get_shares call once per OC_SHARES_TTL.
+    """
+    index = cache.get(OC_SHARES_KEY)
+    if index is None:
+        index = {}
+        for share in get_pool().run(lambda oc: oc.get_shares()):
+            if share.get_path() and "url" in share.share_info:
+                index.setdefault(_share_key(share.get_path()), share.share_info["url"])
+        cache.set(OC_SHARES_KEY, index, timeout=getattr(settings, "OC_SHARES_TTL", 5 * 60))
+    return index
+
+
+def _index_share(path, url):
+    """Record the public link of `path` in the cached share index, if there is one."""
+    index = cache.get(OC_SHARES_KEY)
+    if index is not None:
+        index[_share_key(path)] = url
+        cache.set(OC_SHARES_KEY, index, timeout=getattr(settings, "OC_SHARES_TTL", 5 * 60))
+
+
+def _short_url_index():
+    """
+    Return the YOURLS catalogue as {long url: {"shorturl", "keyword"}}.
+    It is fetched once per YOURLS_INDEX_TTL and patched by shorten/delete in between.
+    """
+    index = cache.get(YOURLS_INDEX_KEY)
+    if index is None:
+        yourls = YOURLSClient(settings.YOURLS_ENDPOINT, signature=settings.YOURLS_SIGNATURE)
+        index = {}
+        for entry in yourls.list():
+            # Keep the first short URL of a long URL shortened several times
+            index.setdefault(entry.url, {"shorturl": entry.shorturl, "keyword": entry.keyword})
+        cache.set(YOURLS_INDEX_KEY, index, timeout=getattr(settings, "YOURLS_INDEX_TTL", 10 * 60))
+    return index
+
+
+def _index_short_url(url, shorturl, keyword):
+    """Add a new short URL to the cached index, if there is one."""
+    index = cache.get(YOURLS_INDEX_KEY)
+    if index is not None:
+        index.setdefault(url, {"shorturl": shorturl, "keyword": keyword})
+        cache.set(YOURLS_INDEX_KEY, index, timeout=getattr(settings, "YOURLS_INDEX_TTL", 10 * 60))
+
+
+def _unindex_short_url(keyword):
+    """Remove a deleted short URL from the cached index, if there is one."""
+    index = cache.get(YOURLS_INDEX_KEY)
+    if index is not None:
+        index = {url: entry for url, entry in index.items() if entry["keyword"] != keyword}
+        cache.set(YOURLS_INDEX_KEY, index, timeout=getattr(settings, "YOURLS_INDEX_TTL", 10 * 60))
+
+
 def get_prev_path(path):
     if len(Path(path).parents) > 1:
         return str(Path(path).parents[0])
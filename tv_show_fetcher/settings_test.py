@@ -28,5 +28,4 @@ YOURLS_SIGNATURE = 'test_sig'
 
 # Avoid writing to real paths during tests
 import tempfile
-TEMP_DIR = tempfile.mkdtemp()
 TO_ADD = tempfile.mkdtemp()